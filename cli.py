@@ -0,0 +1,94 @@
+"""Single entry point for the camera control and image processing scripts.
+
+    python cli.py <command> [arguments of the command]
+
+Only the module of the chosen command is imported, so camera SDKs (pyzed, pyrealsense2, MVS)
+and plotting libraries are loaded only by the commands that use them.
+"""
+
+import os
+import sys
+import time
+import runpy
+import subprocess
+
+
+# Command -> (module, description)
+COMMANDS = {
+    "record": ("record_video", "Record a video with OpenCV"),
+    "record-mp": ("record_video_with_multiprocessing", "Record a video with separate read/write processes"),
+    "record-zed": ("record_zed_svo", "Record a Stereolabs ZED SVO file, or a simulated one"),
+    "hikrobot": ("hikrobot_camera_control", "View and record one or more Hikrobot cameras"),
+    "hikrobot-raw": ("hikrobot_raw_recording", "Demosaic and encode raw Hikrobot recordings in parallel"),
+    "serve": ("frame_server", "Serve one camera to MJPEG/WebSocket viewers and recorders"),
+    "play": ("video_player", "Play a video frame by frame"),
+    "mosaic": ("video_mosaic_player", "Play several videos as one synchronized mosaic"),
+    "play-svo": ("zed_svo_player", "Play a ZED SVO file"),
+    "convert-svo": ("convert_zed_svo_to_video_or_images", "Export a ZED SVO file to video or images"),
+    "avi-to-mp4": ("convert_avi_to_mp4", "Convert an AVI video to MP4"),
+    "video-to-images": ("convert_video_to_images", "Sample frames from a video"),
+    "images-to-video": ("convert_images_to_video", "Concatenate images to a video"),
+    "depth": ("realsense_detect_distance", "Measure distances with an Intel Realsense camera"),
+    "point-cloud": ("realsense_point_cloud", "Point clouds from an Intel Realsense camera"),
+    "centers": ("find_centers_of_contours_in_images", "Find the centers of contours in images"),
+    "track": ("track_centers_in_video", "Track the centers of contours across video frames"),
+}
+
+
+def usage():
+    lines = [__doc__.strip(), "", "commands:"]
+    width = max(len(command) for command in COMMANDS)
+    lines += [f"  {command:<{width}}  {description}" for command, (_, description) in COMMANDS.items()]
+    lines.append(f"  {'startup':<{width}}  Measure the import time of every command and a process spawn")
+    return "\n".join(lines)
+
+
+def _time_python(code, repeats):
+    """Best wall time of running code in a fresh interpreter, and its exit code"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    best, returncode = float("inf"), 0
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, "-c", code], cwd=here, capture_output=True)
+        best = min(best, time.perf_counter() - start)
+        returncode = result.returncode
+    return best, returncode
+
+
+def measure_startup(repeats=3):
+    """Print the import time of every command module and the cost of spawning a recorder child process"""
+    baseline, _ = _time_python("pass", repeats)
+    print(f"{'interpreter':<50} {baseline*1000:8.1f} ms")
+    for command, (module, _) in COMMANDS.items():
+        elapsed, returncode = _time_python(f"import {module}", repeats)
+        status = "" if returncode == 0 else "  (import failed)"
+        print(f"{command + ' (' + module + ')':<50} {(elapsed - baseline)*1000:8.1f} ms{status}")
+
+    # A spawned child re-imports the parent's main module before running its target
+    spawn_code = ("import multiprocessing as mp, record_video_with_multiprocessing\n"
+                  "ctx = mp.get_context('spawn'); p = ctx.Process(target=print, args=('',)); p.start(); p.join()")
+    elapsed, _ = _time_python(spawn_code, repeats)
+    print(f"{'spawn child (record-mp)':<50} {(elapsed - baseline)*1000:8.1f} ms")
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] in ("-h", "--help"):
+        print(usage())
+        return
+    command, args = argv[0], argv[1:]
+    if command == "startup":
+        measure_startup()
+        return
+    if command not in COMMANDS:
+        print(f"Unknown command: {command}\n\n{usage()}")
+        sys.exit(2)
+
+    # Run the command's module as a script, with its own argument parsing
+    module = COMMANDS[command][0]
+    sys.argv = [sys.argv[0]] + args
+    runpy.run_module(module, run_name="__main__", alter_sys=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,97 @@
 """Convert an AVI video file to MP4 format using OpenCV."""
 
+import os
+import argparse
 import cv2
 
-# 1. Open the source .avi file
-input_path = '/Captures/sample.avi'
-cap = cv2.VideoCapture(input_path)
-if not cap.isOpened():
-    raise IOError(f"Cannot open video file {input_path}")
-
-# 2. Prepare the .mp4 writer
-fourcc = cv2.VideoWriter_fourcc(*'mp4v')  # or 'H','2','6','4' if your build supports it
-fps    = cap.get(cv2.CAP_PROP_FPS)
-w      = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-h      = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-output_path = input_path.replace('.avi','.mp4')
-out = cv2.VideoWriter(output_path, fourcc, fps, (w, h))
-
-# 3. Read & write frames
-while True:
-    ret, frame = cap.read()
-    if not ret:
-        break
-    out.write(frame)
-
-# 4. Clean up
-cap.release()
-out.release()
-print(f"Conversion complete: saved to {output_path}")
+from video_writers import open_writer, add_writer_arguments, writer_options
+from follow_recording import RecordingFollower
+
+
+INPUT_PATH = '/Captures/sample.avi'
+CODEC = 'mp4v'              # or 'H264' if your OpenCV build (or the ffmpeg backend) supports it
+
+
+def convert_avi_to_mp4(input_path, output_path=None, backend="opencv", codec=CODEC, **writer_opts):
+    """Convert an .avi file to .mp4, next to it unless output_path is given, with the opencv or ffmpeg writer"""
+
+    # 1. Open the source .avi file
+    cap = cv2.VideoCapture(input_path)
+    if not cap.isOpened():
+        raise IOError(f"Cannot open video file {input_path}")
+
+    # 2. Prepare the .mp4 writer
+    fps    = cap.get(cv2.CAP_PROP_FPS)
+    w      = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    h      = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    if output_path is None:
+        output_path = input_path.replace('.avi','.mp4')
+    out = open_writer(output_path, fps, (w, h), backend, codec, **writer_opts)
+
+    # 3. Read & write frames
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        out.write(frame)
+
+    # 4. Clean up
+    cap.release()
+    out.release()
+    print(f"Conversion complete: saved to {output_path}")
+    return output_path
+
+
+def follow_avi_to_mp4(source, output_dir=None, checkpoint_file=None, backend="opencv", codec=CODEC, **writer_opts):
+    """
+    Convert a recording while it is being written: source is an .avi file or a glob pattern of its
+    segments, each segment becomes its own .mp4 (in output_dir, or next to it). A partial .mp4 cannot
+    be appended to, so a resumed follower skips the segments already converted and converts the
+    interrupted one again from its start.
+    """
+    out = None
+    output_path = None
+
+    def finish_segment(path, frame_count):
+        nonlocal out
+        if out is not None:
+            out.release()
+            out = None
+            print(f"Conversion complete: saved to {output_path}")
+        follower.checkpoint(path, frame_count, force=True, finished=True)
+
+    follower = RecordingFollower(source, checkpoint_file, on_segment_end=finish_segment)
+    if follower.position is not None and not follower.state.get("finished"):
+        follower.position = (follower.position[0], 0)
+    count = 0
+    try:
+        for path, index, frame in follower.frames():
+            if out is None:
+                output_path = os.path.splitext(path)[0] + '.mp4'
+                if output_dir is not None:
+                    output_path = os.path.join(output_dir, os.path.basename(output_path))
+                out = open_writer(output_path, follower.fps, follower.frame_size, backend, codec, **writer_opts)
+            out.write(frame)
+            count += 1
+    finally:
+        if out is not None:
+            # Interrupted mid-segment: the partial .mp4 is closed but the segment is not marked finished
+            out.release()
+    print(f"Followed {count} frames of {source}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('input_path', type=str, nargs='?', help='Path to the .avi file', default=INPUT_PATH)
+    parser.add_argument('--output_path', type=str, help='Path to the .mp4 file (its directory with --follow)', default=None)
+    parser.add_argument('--codec', type=str, help='FourCC or ffmpeg encoder name', default=CODEC)
+    parser.add_argument('--follow', action='store_true',
+                        help='Convert while the recording is written, input_path may be a glob of its segments')
+    parser.add_argument('--checkpoint_file', type=str, help='Progress file to resume following from', default=None)
+    add_writer_arguments(parser)
+    opt = parser.parse_args()
+    if opt.follow:
+        follow_avi_to_mp4(opt.input_path, opt.output_path, opt.checkpoint_file, opt.writer_backend, opt.codec,
+                          **writer_options(opt))
+    else:
+        convert_avi_to_mp4(opt.input_path, opt.output_path, opt.writer_backend, opt.codec, **writer_options(opt))
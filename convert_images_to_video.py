@@ -4,6 +4,10 @@ import os
 import time
 import cv2
 
+from video_writers import open_writer
+from video_timestamps import open_timestamps
+from frame_store import FrameStore, is_frame_store
+
 
 # Set capture index, resolution, frame rate, duration and video type
 FRAMES_DIR = "frames"       # directory containing frames
@@ -18,6 +22,10 @@ OUTPUT_VIDEO_FILE = f"videos/{TIMESTAMP}_{RESOLUTION}@{FPS}.{VIDEO_TYPE}"
 CODEC = {'avi': 'MJPG', 'mp4': 'H264'}
 FOURCC = cv2.VideoWriter_fourcc(*CODEC[VIDEO_TYPE])         # type: ignore
 
+# Video writer backend: "opencv" (cv2.VideoWriter) or "ffmpeg" (raw frames piped to an ffmpeg process)
+WRITER_BACKEND = 'opencv'
+WRITER_OPTIONS = {}         # ffmpeg only, e.g. {"preset": "veryfast", "threads": 4, "crf": 23}
+
 # Standard video resolutions, scaling
 STD_RESOLUTIONS =  {
     "360p": (640, 360),
@@ -29,17 +37,40 @@ STD_RESOLUTIONS =  {
     "4K": (3840, 2160)}
 WIDTH, HEIGHT = STD_RESOLUTIONS[RESOLUTION][0], STD_RESOLUTIONS[RESOLUTION][1]
 
-# List all files in the directory
-frames = [f for f in os.listdir(FRAMES_DIR) if f.endswith(".png")]  # Assuming frames are .png
 
-# Sort frames to ensure they are in correct order
-frames.sort()
+def convert_frame_store_to_video(store_dir, output_video_file=OUTPUT_VIDEO_FILE):
+    """Write the frames of a frame store to a video, with their timestamps in its sidecar file"""
+
+    store = FrameStore(store_dir)
+    out = open_writer(output_video_file, FPS, store.frame_size, WRITER_BACKEND, CODEC[VIDEO_TYPE], **WRITER_OPTIONS)
+    with open_timestamps(output_video_file) as sidecar:
+        for count, (frame_number, timestamp, frame) in enumerate(store.frames()):
+            out.write(frame)
+            sidecar.write(f"{count},{timestamp:.6f}\n")
+    out.release()
+
+
+def convert_images_to_video(frames_dir=FRAMES_DIR, output_video_file=OUTPUT_VIDEO_FILE):
+    """Concatenate the .png frames of a directory, in name order, or the frames of a frame store, to a video"""
+
+    if is_frame_store(frames_dir):
+        return convert_frame_store_to_video(frames_dir, output_video_file)
+
+    # List all files in the directory
+    frames = [f for f in os.listdir(frames_dir) if f.endswith(".png")]  # Assuming frames are .png
+
+    # Sort frames to ensure they are in correct order
+    frames.sort()
+
+    out = open_writer(output_video_file, FPS, (WIDTH, HEIGHT), WRITER_BACKEND, CODEC[VIDEO_TYPE], **WRITER_OPTIONS)
+    # Concatenate frames to create video
+    for frame_name in frames:
+        frame = cv2.imread(os.path.join(frames_dir, frame_name))
+        out.write(frame)
+
+    # Release the video writer object
+    out.release()
 
-out = cv2.VideoWriter(OUTPUT_VIDEO_FILE, FOURCC, FPS, (WIDTH, HEIGHT))
-# Concatenate frames to create video
-for frame_name in frames:
-    frame = cv2.imread(os.path.join(FRAMES_DIR, frame_name))
-    out.write(frame)
 
-# Release the video writer object
-out.release()
+if __name__ == "__main__":
+    convert_images_to_video()
@@ -1,40 +1,141 @@
 """Sample frames from video(s) using OpenCV."""
 import os
+import argparse
+import numpy as np
 import cv2
 
+from follow_recording import RecordingFollower
+from frame_store import FrameStoreWriter
 
-def split_video_to_frames(full_video_path, sample_method):
 
-    capture = cv2.VideoCapture(full_video_path)
-    video_fps = capture.get(cv2.CAP_PROP_FPS)
-    print(f"\nVideo name : {full_video_path[full_video_path.rfind('/')+1:-4]}\n"+
-          f"Video fps : {video_fps}")
-    FRAME_ID = 0
+# Set sampling parameters
+SAMPLE_RATIO = 0.3 # sample SAMPLE_RATIO frames per second 
+START_TIME = 0 # start from START_TIME seconds in the video
+END_TIME = 10 # end at END_TIME seconds in the video
 
-    while capture.isOpened():
+# Near-duplicate filtering: skip frames whose perceptual hash differs by at most DEDUP_DISTANCE bits
+# (of 64) from one of the last DEDUP_HISTORY written frames, None writes every sampled frame
+DEDUP_DISTANCE = None
+DEDUP_HISTORY = 8
+HASH_SIZE = 8               # the hash has HASH_SIZE x HASH_SIZE bits
 
-        success, frame = capture.read()
-        
-        if success:
 
-            FRAME_ID += 1
+def perceptual_hash(frame, hash_size=HASH_SIZE):
+    """
+    DCT hash of a frame: the lowest hash_size x hash_size frequencies of a 32x32 grayscale copy,
+    one bit per frequency above their median, packed into bytes. A distance of about 10 bits or
+    less between two hashes marks near-identical frames.
+    """
+    small = cv2.resize(frame, (4 * hash_size, 4 * hash_size), interpolation=cv2.INTER_AREA)
+    if small.ndim == 3:
+        small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    frequencies = cv2.dct(small.astype(np.float32))[:hash_size, :hash_size]
+    # The DC term only carries the brightness, it is left out of the median
+    return np.packbits(frequencies > np.median(frequencies.flat[1:]))
 
-             # sample SAMPLE_RATIO frames per second or sample from START_TIME to END_TIME seconds
-            if ((sample_method == 'sample_frequently' and not ((FRAME_ID*SAMPLE_RATIO) % int(video_fps))) or 
-            (sample_method == 'sample_time_interval' and START_TIME < FRAME_ID/video_fps < END_TIME)):
-                full_frame_path = full_video_path.replace("videos","frames").replace(".avi","")
-                cv2.imwrite(f'{full_frame_path}_t{(FRAME_ID/int(video_fps)):07.3f}.png', frame)
-        else:
-            break
 
-    capture.release()
+class FrameDeduplicator:
+    """Recognize frames within max_distance hash bits of one of the last `history` kept frames"""
+
+    def __init__(self, max_distance=DEDUP_DISTANCE, history=DEDUP_HISTORY, hash_size=HASH_SIZE):
+        self.max_distance = max_distance
+        self.hash_size = hash_size
+        self.hashes = np.zeros((history, hash_size * hash_size // 8), np.uint8)
+        self.count = 0
+        self.skipped = 0
+
+    def is_duplicate(self, frame):
+        """Whether to skip the frame, otherwise it is remembered as kept"""
+        frame_hash = perceptual_hash(frame, self.hash_size)
+        recent = self.hashes[:min(self.count, len(self.hashes))]
+        if len(recent) and np.unpackbits(recent ^ frame_hash, axis=1).sum(axis=1).min() <= self.max_distance:
+            self.skipped += 1
+            return True
+        self.hashes[self.count % len(self.hashes)] = frame_hash
+        self.count += 1
+        return False
+
+
+def sample_frame(full_video_path, FRAME_ID, video_fps, frame, sample_method, dedup=None, store=None):
+    """Write the frame (FRAME_ID counting from 1), as a PNG or to the frame store, if the sampling method selects it"""
+
+     # sample SAMPLE_RATIO frames per second or sample from START_TIME to END_TIME seconds
+    if ((sample_method == 'sample_frequently' and not ((FRAME_ID*SAMPLE_RATIO) % int(video_fps))) or 
+    (sample_method == 'sample_time_interval' and START_TIME < FRAME_ID/video_fps < END_TIME)):
+        # Near-duplicates are dropped before the PNG encoding
+        if dedup is not None and dedup.is_duplicate(frame):
+            return
+        if store is not None:
+            store.write(frame, FRAME_ID, FRAME_ID/video_fps)
+            return
+        full_frame_path = full_video_path.replace("videos","frames").replace(".avi","")
+        cv2.imwrite(f'{full_frame_path}_t{(FRAME_ID/int(video_fps)):07.3f}.png', frame)
+
+
+def split_video_to_frames(full_video_path, sample_method, dedup_distance=DEDUP_DISTANCE, follow=False,
+                          checkpoint_file=None, frame_store=None):
+
+    dedup = FrameDeduplicator(dedup_distance) if dedup_distance is not None else None
+    store = None
+
+    if follow:
+        # Sample the recording (or its segments, as a glob pattern) while it is being written
+        follower = RecordingFollower(full_video_path, checkpoint_file)
+        if frame_store is not None:
+            # A resumed follower appends to the frames stored up to its checkpoint
+            resume_count = (follower.state.get("stored") or 0) if follower.position is not None else None
+            store = FrameStoreWriter(frame_store, resume_count=resume_count)
+        segment = None
+        for segment, index, frame in follower.frames():
+            sample_frame(segment, index + 1, follower.fps, frame, sample_method, dedup, store)
+            follower.checkpoint(segment, index + 1, stored=store.count if store is not None else None)
+        if segment is not None:
+            follower.checkpoint(segment, index + 1, force=True, stored=store.count if store is not None else None)
+    else:
+        # Sampled frames go to a chunked memory-mapped frame store instead of PNG files if a directory is given
+        store = FrameStoreWriter(frame_store) if frame_store is not None else None
+        capture = cv2.VideoCapture(full_video_path)
+        video_fps = capture.get(cv2.CAP_PROP_FPS)
+        print(f"\nVideo name : {full_video_path[full_video_path.rfind('/')+1:-4]}\n"+
+              f"Video fps : {video_fps}")
+        FRAME_ID = 0
+
+        while capture.isOpened():
+
+            success, frame = capture.read()
+            
+            if success:
+
+                FRAME_ID += 1
+                sample_frame(full_video_path, FRAME_ID, video_fps, frame, sample_method, dedup, store)
+            else:
+                break
+
+        capture.release()
+
+    if store is not None:
+        store.release()
+        print(f"Stored {store.count} frames in {frame_store}")
+    if dedup is not None:
+        print(f"Wrote {dedup.count} frames, skipped {dedup.skipped} near-duplicates")
 
 if __name__ == "__main__":
 
     # Set videos directory 
-    SAMPLE_RATIO = 0.3 # sample SAMPLE_RATIO frames per second 
-    START_TIME = 0 # start from START_TIME seconds in the video
-    END_TIME = 10 # end at END_TIME seconds in the video
     full_video_path = f"/sample.avi"
 
-    split_video_to_frames(full_video_path, sample_method='sample_frequently')
+    parser = argparse.ArgumentParser()
+    parser.add_argument('video_path', type=str, nargs='?', help='Path to the video file', default=full_video_path)
+    parser.add_argument('--sample_method', type=str, choices=['sample_frequently', 'sample_time_interval'],
+                        default='sample_frequently')
+    parser.add_argument('--dedup_distance', type=int, default=DEDUP_DISTANCE,
+                        help='Skip frames within this many hash bits of a recently written frame')
+    parser.add_argument('--follow', action='store_true',
+                        help='Sample while the recording is written, video_path may be a glob of its segments')
+    parser.add_argument('--checkpoint_file', type=str, help='Progress file to resume following from', default=None)
+    parser.add_argument('--frame_store', type=str, help='Directory of a frame store to write instead of PNG files',
+                        default=None)
+    opt = parser.parse_args()
+
+    split_video_to_frames(opt.video_path, sample_method=opt.sample_method, dedup_distance=opt.dedup_distance,
+                          follow=opt.follow, checkpoint_file=opt.checkpoint_file, frame_store=opt.frame_store)
@@ -19,13 +19,13 @@
 ########################################################################
 
 import sys
-import pyzed.sl as sl
 import numpy as np
 import cv2
 from pathlib import Path
 import enum
 import argparse
 import os 
+from video_writers import open_writer, add_writer_arguments, writer_options
 
 class AppType(enum.Enum):
     LEFT_AND_RIGHT = 1
@@ -42,6 +42,8 @@ def progress_bar(percent_done, bar_length=50):
 
 
 def main(opt):
+    import pyzed.sl as sl
+
     # Get input parameters
     svo_input_path = opt.input_svo_file
     output_dir = opt.output_path_dir
@@ -95,12 +97,11 @@ def main(opt):
     video_writer = None
     if output_as_video:
         # Create video writer with MPEG-4 part 2 codec
-        video_writer = cv2.VideoWriter(avi_output_path,
-                                       cv2.VideoWriter_fourcc('M', '4', 'S', '2'),
-                                       max(zed.get_camera_information().camera_configuration.fps, 25),
-                                       (width_sbs, height))
+        video_writer = open_writer(avi_output_path,
+                                   max(zed.get_camera_information().camera_configuration.fps, 25),
+                                   (width_sbs, height), opt.writer_backend, 'M4S2', **writer_options(opt))
         if not video_writer.isOpened():
-            sys.stdout.write("OpenCV video writer cannot be opened. Please check the .avi file path and write "
+            sys.stdout.write("Video writer cannot be opened. Please check the .avi file path and write "
                              "permissions.\n")
             zed.close()
             exit()
@@ -174,6 +175,7 @@ if __name__ == "__main__":
     parser.add_argument('--input_svo_file', type=str, required=True, help='Path to the .svo file')
     parser.add_argument('--output_avi_file', type=str, help='Path to the output .avi file, if mode includes a .avi export', default = '')
     parser.add_argument('--output_path_dir', type = str, help = 'Path to a directory, where .png will be written, if mode includes image sequence export', default = '')
+    add_writer_arguments(parser)
     opt = parser.parse_args()
     if opt.mode > 4 or opt.mode < 0 :
         print("Mode shoud be between 0 and 4 included. \n Mode 0 is to export LEFT+RIGHT AVI. \n Mode 1 is to export LEFT+DEPTH_VIEW AVI. \n Mode 2 is to export LEFT+RIGHT image sequence. \n Mode 3 is to export LEFT+DEPTH_View image sequence. \n Mode 4 is to export LEFT+DEPTH_16BIT image sequence.")
@@ -0,0 +1,217 @@
+"""Follow a recording that is still being written, or its segments, frame by frame with checkpoints."""
+
+import os
+import glob
+import json
+import time
+import struct
+import numpy as np
+import cv2
+
+
+POLL_INTERVAL = 0.5         # seconds between checks for new data
+IDLE_TIMEOUT = 5            # seconds without growth or a new segment after which the recording has ended
+CHECKPOINT_INTERVAL = 1     # minimum seconds between checkpoint writes
+
+
+class RecordingFollower:
+    """
+    Yield the frames of a video file that is still being written, or of the segments matching a glob
+    pattern in name order, as they reach the disk. MJPEG AVI files are read as they grow, other formats
+    once their segment is complete. A segment is complete once its writer closed it or a later segment
+    exists, and the recording has ended when nothing grew for idle_timeout seconds (or, for a single
+    file, when it is closed).
+
+    Progress is saved to checkpoint_file by checkpoint() and a new follower resumes from it.
+    on_segment_end(segment, frame_count) is called once each segment has been read to its end.
+    """
+
+    def __init__(self, source, checkpoint_file=None, poll_interval=POLL_INTERVAL, idle_timeout=IDLE_TIMEOUT,
+                 on_segment_end=None):
+        self.source = source
+        self.checkpoint_file = checkpoint_file
+        self.on_segment_end = on_segment_end
+        self.poll_interval = poll_interval
+        self.idle_timeout = idle_timeout
+        self.fps = None             # frame rate of the segment being read
+        self.frame_size = None      # (width, height) of the segment being read
+        self.last_checkpoint = 0
+        self.state = {}             # what the consumer saved with the checkpoint
+        self.position = self._load_checkpoint()
+
+    def _load_checkpoint(self):
+        """(segment, frame) to resume from, or None"""
+        if self.checkpoint_file is None or not os.path.isfile(self.checkpoint_file):
+            return None
+        with open(self.checkpoint_file) as f:
+            checkpoint = json.load(f)
+        if checkpoint.get("source") != self.source:
+            return None
+        self.state = checkpoint.get("state", {})
+        return checkpoint["segment"], checkpoint["frame"]
+
+    def checkpoint(self, segment, frame, force=False, **state):
+        """
+        Record that the frames of segment before frame, and all earlier segments, are processed, with
+        the consumer's own progress (e.g. how many frames it stored) as state
+        """
+        if self.checkpoint_file is None:
+            return
+        now = time.monotonic()
+        if not force and now - self.last_checkpoint < CHECKPOINT_INTERVAL:
+            return
+        self.last_checkpoint = now
+        tmp_file = f"{self.checkpoint_file}.{os.getpid()}.tmp"
+        with open(tmp_file, "w") as f:
+            json.dump({"source": self.source, "segment": segment, "frame": frame, "state": state}, f)
+        os.replace(tmp_file, self.checkpoint_file)
+
+    def segments(self):
+        if glob.has_magic(self.source):
+            return sorted(glob.glob(self.source))
+        return [self.source] if os.path.isfile(self.source) else []
+
+    def frames(self):
+        """Yield (segment, frame_index, frame), frame_index counting from 0 within each segment"""
+        resume_segment, resume_frame = self.position or (None, 0)
+        finished = None             # last segment read to its end
+        waiting_since = time.monotonic()
+        while True:
+            pending = [path for path in self.segments()
+                       if (finished is None or path > finished) and (resume_segment is None or path >= resume_segment)]
+            if not pending:
+                # The recorder has not created its first (or next) file yet
+                if time.monotonic() - waiting_since >= self.idle_timeout:
+                    if finished is None:
+                        print(f"Nothing to follow at {self.source}")
+                    return
+                time.sleep(self.poll_interval)
+                continue
+
+            path = pending[0]
+            ended, frame_count = yield from self._follow_segment(path, resume_frame if path == resume_segment else 0)
+            if self.on_segment_end is not None:
+                self.on_segment_end(path, frame_count)
+            if ended:
+                return
+            finished = path
+            waiting_since = time.monotonic()
+
+    def _follow_segment(self, path, next_frame):
+        """
+        Yield the frames of one segment from next_frame on; return whether the whole recording ended, and
+        the number of frames of the segment
+        """
+        scanner = AviScanner(path) if path.lower().endswith(".avi") else None
+        last_size, last_growth = -1, time.monotonic()
+        try:
+            while True:
+                size = os.path.getsize(path)
+                if size != last_size:
+                    last_size, last_growth = size, time.monotonic()
+                # Decided before reading, so that every frame read afterwards is complete
+                has_successor = any(later > path for later in self.segments())
+                ended = time.monotonic() - last_growth >= self.idle_timeout
+
+                if scanner is not None and scanner.mjpeg is not False:
+                    # Only the chunks added since the last poll are read and decoded
+                    for frame in scanner.frames(size, skip=next_frame, complete=has_successor or ended):
+                        self.fps, self.frame_size = scanner.fps, scanner.frame_size
+                        yield path, next_frame, frame
+                        next_frame += 1
+                    if scanner.closed:
+                        # A closed single file is the whole recording, the next segment of a glob may still follow
+                        return not glob.has_magic(self.source), next_frame
+                    if scanner.mjpeg is False:
+                        continue
+
+                elif has_successor or ended:
+                    # Other formats cannot be read while they grow, the segment is read once it is complete
+                    next_frame = yield from self._read_segment(path, next_frame)
+
+                if has_successor or ended:
+                    return ended and not has_successor, next_frame
+                time.sleep(self.poll_interval)
+        finally:
+            if scanner is not None:
+                scanner.close()
+
+    def _read_segment(self, path, next_frame):
+        capture = cv2.VideoCapture(path)
+        self.fps = capture.get(cv2.CAP_PROP_FPS)
+        self.frame_size = (int(capture.get(cv2.CAP_PROP_FRAME_WIDTH)), int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        if next_frame:
+            capture.set(cv2.CAP_PROP_POS_FRAMES, next_frame)
+        while True:
+            success, frame = capture.read()
+            if not success:
+                break
+            yield path, next_frame, frame
+            next_frame += 1
+        capture.release()
+        return next_frame
+
+
+class AviScanner:
+    """
+    Read the frames of a growing MJPEG AVI file incrementally: the file is walked chunk by chunk from
+    where the last call stopped, and a frame is decoded once its whole chunk is on disk. The sizes of the
+    RIFF and LIST headers are only final once the writer closes, so lists are entered rather than skipped.
+    mjpeg is None until the stream format is known, and False for AVI files of other codecs.
+    """
+
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.offset = 0
+        self.count = 0              # frame chunks passed
+        self.fps = None
+        self.frame_size = None
+        self.mjpeg = None
+        self.closed = False         # the writer finished the file (its idx1 index is written)
+        self._video_format = False  # the next strf chunk describes the video stream
+
+    def close(self):
+        self.file.close()
+
+    def frames(self, size, skip=0, complete=False):
+        """Yield the frames completed below size, after the first `skip` frames (which are not decoded)"""
+        while self.offset + 8 <= size and not self.closed:
+            self.file.seek(self.offset)
+            fourcc, chunk_size = struct.unpack("<4sI", self.file.read(8))
+            if fourcc in (b"RIFF", b"LIST"):
+                if self.offset + 12 > size:
+                    break
+                self.offset += 12
+                continue
+            if fourcc == b"idx1":
+                self.closed = True
+                break
+            is_frame = fourcc[:2].isdigit() and fourcc[2:] in (b"dc", b"db")
+            # Some writers patch the size of a frame chunk after writing its data
+            if self.offset + 8 + chunk_size > size or (is_frame and chunk_size == 0 and not complete):
+                break
+            data = self.file.read(chunk_size) if not is_frame or self.count >= skip else None
+            self.offset += 8 + chunk_size + (chunk_size & 1)
+
+            if fourcc == b"strh" and data[:4] == b"vids":
+                scale, rate = struct.unpack_from("<II", data, 20)
+                self.fps = rate / scale if scale else None
+                self._video_format = True
+            elif fourcc == b"strf" and self._video_format:
+                width, height, _, _, compression = struct.unpack_from("<iiHH4s", data, 4)
+                self.frame_size = (width, abs(height))
+                self.mjpeg = compression.upper() == b"MJPG"
+                self._video_format = False
+            elif is_frame and chunk_size:
+                if self.mjpeg is False:
+                    # Not decodable here, the caller reads the file once it is complete
+                    self.offset -= 8 + chunk_size + (chunk_size & 1)
+                    break
+                if data is not None:
+                    frame = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+                    if frame is None:
+                        self.offset -= 8 + chunk_size + (chunk_size & 1)
+                        self.mjpeg = False
+                        break
+                    yield frame
+                self.count += 1
@@ -0,0 +1,319 @@
+"""Serve one camera to many local viewers (MJPEG over HTTP, WebSocket) and recorders using asyncio."""
+
+import sys
+import time
+import base64
+import asyncio
+import hashlib
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+import cv2
+
+from video_writers import open_writer, add_writer_arguments, writer_options
+
+
+# Set capture index, resolution, frame rate and server address
+CAMERA_INDEX = 2            # {0, 2}
+WIDTH, HEIGHT = 1920, 1080
+FPS = 30
+HOST = "127.0.0.1"
+PORT = 8080
+DEFAULT_QUALITY = 80        # JPEG quality when a client does not ask for one
+RECORDER_QUEUE_SIZE = 30    # frames buffered for each recorder before they are dropped
+MAX_READ_FAILURES = 10      # consecutive failed reads after which the camera is given up and the server stops
+READ_RETRY_DELAY = 0.01     # seconds waited after a failed read, doubled on each further failure (up to 1 s)
+
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+BOUNDARY = "frame"
+
+
+class CameraStopped(Exception):
+    """Raised to the clients waiting for a frame once the camera has stopped"""
+
+
+class FrameHub:
+    """
+    Latest camera frame shared by all clients. Each frame is JPEG-encoded at most once per
+    requested quality, and viewers always wait for the newest frame, so a slow viewer skips
+    frames instead of buffering them.
+    """
+
+    def __init__(self):
+        self.frame = None
+        self.sequence = 0
+        self.timestamp = 0.0
+        self.new_frame = asyncio.Condition()
+        self.encoded = {}           # quality -> (sequence, future of the JPEG bytes)
+        self.recorders = []
+        self.viewers = 0
+        self.clients = set()        # handler tasks of the connected clients
+        self.stopped = False
+
+    async def publish(self, frame, timestamp):
+        """Make a captured frame the latest one and wake up the clients"""
+        self.frame, self.timestamp = frame, timestamp
+        self.sequence += 1
+        for recorder in self.recorders:
+            if recorder.qsize() >= RECORDER_QUEUE_SIZE:
+                recorder.dropped += 1
+            else:
+                recorder.put_nowait((frame, timestamp))
+        async with self.new_frame:
+            self.new_frame.notify_all()
+
+    async def next_frame(self, last_sequence):
+        """Wait for a frame newer than last_sequence, raising CameraStopped if the camera stops first"""
+        async with self.new_frame:
+            await self.new_frame.wait_for(lambda: self.sequence > last_sequence or self.stopped)
+        if self.sequence <= last_sequence:
+            raise CameraStopped
+        return self.sequence
+
+    async def stop(self):
+        """End the stream: recorders get None after their last frame, waiting viewers are woken and awaited"""
+        self.stopped = True
+        for recorder in self.recorders:
+            recorder.put_nowait(None)
+        async with self.new_frame:
+            self.new_frame.notify_all()
+        await asyncio.gather(*self.clients, return_exceptions=True)
+
+    async def jpeg(self, quality):
+        """JPEG bytes of the latest frame, encoded off the event loop once per quality"""
+        sequence = self.sequence
+        cached = self.encoded.get(quality)
+        if cached is None or cached[0] != sequence:
+            frame = self.frame
+            loop = asyncio.get_running_loop()
+            cached = (sequence, loop.run_in_executor(
+                None, lambda: cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes()))
+            self.encoded[quality] = cached
+        return await cached[1]
+
+    def subscribe_recorder(self):
+        """
+        Queue receiving every (frame, timestamp) for a recorder, then None when the stream ends. Frames are
+        dropped and counted while RECORDER_QUEUE_SIZE are waiting, the final None always fits.
+        """
+        recorder = asyncio.Queue()
+        recorder.dropped = 0
+        self.recorders.append(recorder)
+        return recorder
+
+
+def capture_frames(hub, loop, stop_event, camera_stopped):
+    """
+    Read the camera on a dedicated thread and publish each frame to the hub. If the camera cannot be
+    opened or stops delivering frames, the reason is set on the camera_stopped future so the server stops.
+    """
+    capture = cv2.VideoCapture(CAMERA_INDEX)
+    capture.set(cv2.CAP_PROP_FRAME_WIDTH, WIDTH)
+    capture.set(cv2.CAP_PROP_FRAME_HEIGHT, HEIGHT)
+    capture.set(cv2.CAP_PROP_FPS, FPS)
+    reason = None if capture.isOpened() else f"Could not open camera {CAMERA_INDEX}"
+    failures = 0
+    while reason is None and not stop_event.is_set():
+        ret, frame = capture.read()
+        if not ret:
+            failures += 1
+            if failures >= MAX_READ_FAILURES:
+                reason = f"Camera {CAMERA_INDEX} failed {failures} reads in a row"
+            else:
+                # Back off instead of spinning on a camera that is not delivering
+                stop_event.wait(min(READ_RETRY_DELAY * 2 ** (failures - 1), 1.0))
+            continue
+        failures = 0
+        try:
+            asyncio.run_coroutine_threadsafe(hub.publish(frame, time.time()), loop)
+        except RuntimeError:
+            break       # the event loop is already closed
+    capture.release()
+    if reason is not None:
+        try:
+            loop.call_soon_threadsafe(lambda: camera_stopped.done() or camera_stopped.set_result(reason))
+        except RuntimeError:
+            pass    # the event loop is already closed
+
+
+async def serve_mjpeg(hub, writer, quality):
+    """Stream multipart JPEG frames until the viewer disconnects"""
+    writer.write(("HTTP/1.1 200 OK\r\n"
+                  f"Content-Type: multipart/x-mixed-replace; boundary={BOUNDARY}\r\n"
+                  "Cache-Control: no-cache\r\nConnection: close\r\n\r\n").encode())
+    sequence = 0
+    while True:
+        sequence = await hub.next_frame(sequence)
+        jpeg = await hub.jpeg(quality)
+        writer.write(f"--{BOUNDARY}\r\nContent-Type: image/jpeg\r\nContent-Length: {len(jpeg)}\r\n\r\n".encode())
+        writer.write(jpeg)
+        writer.write(b"\r\n")
+        await writer.drain()
+
+
+def websocket_header(opcode, length):
+    """Header of an unmasked WebSocket frame: FIN + opcode, then the payload length in 7, 16 or 64 bits"""
+    if length < 126:
+        return bytes((0x80 | opcode, length))
+    if length < 1 << 16:
+        return bytes((0x80 | opcode, 126)) + length.to_bytes(2, "big")
+    return bytes((0x80 | opcode, 127)) + length.to_bytes(8, "big")
+
+
+async def read_websocket(reader, writer):
+    """Read the viewer's frames, answering pings, and return once it closes the connection or drops it"""
+    try:
+        while True:
+            head = await reader.readexactly(2)
+            opcode, length = head[0] & 0x0F, head[1] & 0x7F
+            if length == 126:
+                length = int.from_bytes(await reader.readexactly(2), "big")
+            elif length == 127:
+                length = int.from_bytes(await reader.readexactly(8), "big")
+            mask = await reader.readexactly(4) if head[1] & 0x80 else bytes(4)
+            payload = await reader.readexactly(length)
+            if opcode < 0x8:
+                continue        # data from the viewer is not used
+            payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+            if opcode == 0x8:
+                # Echo the close status code, as the protocol asks
+                writer.write(websocket_header(0x8, min(length, 2)) + payload[:2])
+                return
+            if opcode == 0x9:
+                writer.write(websocket_header(0xA, length) + payload)
+    except (asyncio.IncompleteReadError, ConnectionError):
+        return
+
+
+async def serve_websocket(hub, reader, writer, headers, quality):
+    """Send each frame as one binary WebSocket message until the viewer closes the connection"""
+    key = headers.get("sec-websocket-key")
+    if not key:
+        writer.write(b"HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+        await writer.drain()
+        return
+    accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode()).digest())
+    writer.write(b"HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                 b"Sec-WebSocket-Accept: " + accept + b"\r\n\r\n")
+    client = asyncio.create_task(read_websocket(reader, writer))
+    sequence = 0
+    try:
+        while True:
+            next_frame = asyncio.create_task(hub.next_frame(sequence))
+            await asyncio.wait((next_frame, client), return_when=asyncio.FIRST_COMPLETED)
+            if client.done():
+                next_frame.cancel()
+                await writer.drain()
+                return
+            sequence = next_frame.result()
+            jpeg = await hub.jpeg(quality)
+            writer.write(websocket_header(0x2, len(jpeg)))
+            writer.write(jpeg)
+            await writer.drain()
+    finally:
+        client.cancel()
+
+
+async def handle_client(hub, reader, writer):
+    """Route a viewer by request path: /stream.mjpg or /ws, with an optional ?quality="""
+    task = asyncio.current_task()
+    hub.clients.add(task)
+    try:
+        request_line = (await reader.readline()).decode(errors="replace").split()
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode(errors="replace").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        if len(request_line) < 2:
+            return
+        url = urlsplit(request_line[1])
+        quality = int(parse_qs(url.query).get("quality", [DEFAULT_QUALITY])[0])
+        quality = min(max(quality, 1), 100)
+
+        hub.viewers += 1
+        try:
+            if url.path == "/ws" and headers.get("upgrade", "").lower() == "websocket":
+                await serve_websocket(hub, reader, writer, headers, quality)
+            elif url.path == "/stream.mjpg":
+                await serve_mjpeg(hub, writer, quality)
+            else:
+                writer.write(b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+                await writer.drain()
+        finally:
+            hub.viewers -= 1
+    except (ConnectionError, ValueError, CameraStopped):
+        pass
+    finally:
+        hub.clients.discard(task)
+        writer.close()
+
+
+async def record(hub, output_file, backend="opencv", **writer_opts):
+    """Local recorder client: write every frame it receives to a video file with the opencv or ffmpeg writer"""
+    recorder = hub.subscribe_recorder()
+    loop = asyncio.get_running_loop()
+    item = await recorder.get()
+    if item is None:
+        return
+    height, width = item[0].shape[:2]
+    video_writer = open_writer(output_file, FPS, (width, height), backend, 'MJPG', **writer_opts)
+    # One thread runs the writes and then the release in order, even if this task is cancelled mid-write
+    executor = ThreadPoolExecutor(max_workers=1)
+    try:
+        while item is not None:
+            await loop.run_in_executor(executor, video_writer.write, item[0])
+            item = await recorder.get()
+    finally:
+        release = loop.run_in_executor(executor, video_writer.release)
+        executor.shutdown(wait=False)
+        await release
+        print(f"Recorder dropped {recorder.dropped} frames")
+
+
+async def main(record_file=None, backend="opencv", **writer_opts):
+    """Main"""
+    hub = FrameHub()
+    loop = asyncio.get_running_loop()
+    stop_event = threading.Event()
+    camera_stopped = loop.create_future()
+    capture_thread = threading.Thread(target=capture_frames, args=(hub, loop, stop_event, camera_stopped),
+                                      daemon=True)
+    capture_thread.start()
+
+    recorder_task = asyncio.create_task(record(hub, record_file, backend, **writer_opts)) if record_file else None
+    server = await asyncio.start_server(lambda r, w: handle_client(hub, r, w), HOST, PORT)
+    print(f"Serving http://{HOST}:{PORT}/stream.mjpg and ws://{HOST}:{PORT}/ws, use Ctrl-C to stop.")
+    try:
+        async with server:
+            serve_task = asyncio.create_task(server.serve_forever())
+            await asyncio.wait((serve_task, camera_stopped), return_when=asyncio.FIRST_COMPLETED)
+            if camera_stopped.done():
+                serve_task.cancel()
+                print(f"{camera_stopped.result()}, stopping the server.")
+                # Let the viewers disconnect and the recorder write its last frames
+                await hub.stop()
+                if recorder_task is not None:
+                    await recorder_task
+                return 1
+    finally:
+        stop_event.set()
+        if recorder_task is not None and not recorder_task.done():
+            recorder_task.cancel()
+            # Wait for the write in progress and the release
+            await asyncio.gather(recorder_task, return_exceptions=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--record_file', type=str, help='Also record the camera to this video file', default=None)
+    add_writer_arguments(parser)
+    opt = parser.parse_args()
+    try:
+        exit_code = asyncio.run(main(opt.record_file, opt.writer_backend, **writer_options(opt)))
+    except KeyboardInterrupt:
+        exit_code = 0
+    sys.exit(exit_code)
@@ -0,0 +1,159 @@
+"""Store fixed-shape frames in chunked memory-mapped files, a fast alternative to directories of images."""
+
+import os
+import json
+import time
+import numpy as np
+
+from memmap_chunks import ChunkFiles, find_chunks
+
+
+CHUNK_BYTES = 1 << 30       # approximate size of each chunk file, rounded down to whole frames
+CHUNK_PATTERN = "chunk_{:05d}.frames"
+METADATA_FILE = "store.json"
+INDEX_FILE = "index.bin"
+
+# One index record per frame, appended as the frame is stored
+INDEX_DTYPE = np.dtype([("frame_number", "<i8"),     # frame number in the source video
+                        ("timestamp", "<f8")])       # seconds (video time or host time)
+
+
+def is_frame_store(path):
+    return os.path.isfile(os.path.join(path, METADATA_FILE))
+
+
+class FrameStoreWriter:
+    """
+    Append uint8 frames of one shape to chunk files of chunk_bytes that are preallocated and
+    memory-mapped, and their frame number and timestamp to the index. The shape is taken from the
+    first frame unless given, and the last chunk is truncated to the frames it holds on release.
+
+    With resume_count, an existing store is reopened and appended to after its first resume_count
+    frames (all of them if True), e.g. to continue an interrupted extraction from its checkpoint.
+    """
+
+    def __init__(self, store_dir, frame_shape=None, chunk_bytes=CHUNK_BYTES, resume_count=None):
+        self.store_dir = store_dir
+        self.chunk_bytes = chunk_bytes
+        self.chunks = ChunkFiles(store_dir, CHUNK_PATTERN, chunk_bytes)
+        self.frame_shape = None
+        self.chunk = None
+        self.count = 0
+        index_path = os.path.join(store_dir, INDEX_FILE)
+        if resume_count is not None and is_frame_store(store_dir):
+            self._resume(index_path, frame_shape, resume_count)
+        else:
+            for path in find_chunks(store_dir, CHUNK_PATTERN):
+                os.remove(path)
+            # Unbuffered, so that every stored frame is indexed even if the process is interrupted
+            self.index = open(index_path, "wb", buffering=0)
+            if frame_shape is not None:
+                self._set_shape(tuple(frame_shape))
+
+    def _resume(self, index_path, frame_shape, resume_count):
+        with open(os.path.join(self.store_dir, METADATA_FILE)) as f:
+            metadata = json.load(f)
+        self.frame_shape = tuple(metadata["shape"])
+        self.chunk_frames = metadata["chunk_frames"]
+        if frame_shape is not None and tuple(frame_shape) != self.frame_shape:
+            raise ValueError(f"Cannot append frames of shape {tuple(frame_shape)} to a store of {self.frame_shape}")
+        stored = os.path.getsize(index_path) // INDEX_DTYPE.itemsize
+        self.count = stored if resume_count is True else min(resume_count, stored)
+        # Frames past the resume point, and a record cut short by an interruption, are dropped
+        self.index = open(index_path, "r+b", buffering=0)
+        self.index.truncate(self.count * INDEX_DTYPE.itemsize)
+        self.index.seek(0, os.SEEK_END)
+        kept_chunks = -(-self.count // self.chunk_frames)
+        for path in find_chunks(self.store_dir, CHUNK_PATTERN)[kept_chunks:]:
+            os.remove(path)
+        # A partly filled last chunk is mapped again, a full one is followed by a new chunk
+        self.chunks.index = kept_chunks - 1
+        if self.count % self.chunk_frames:
+            self._open_chunk(kept_chunks - 1)
+
+    def _set_shape(self, frame_shape):
+        self.frame_shape = frame_shape
+        frame_bytes = int(np.prod(frame_shape))
+        self.chunk_frames = max(self.chunk_bytes // frame_bytes, 1)
+        with open(os.path.join(self.store_dir, METADATA_FILE), "w") as f:
+            json.dump({"shape": list(frame_shape), "dtype": "uint8", "chunk_frames": self.chunk_frames}, f)
+
+    def _open_chunk(self, index=None):
+        frame_bytes = int(np.prod(self.frame_shape))
+        chunk = self.chunks.open(index)
+        self.chunk = chunk[:self.chunk_frames * frame_bytes].reshape((self.chunk_frames,) + self.frame_shape)
+
+    def _close_chunk(self):
+        if self.chunk is None:
+            return
+        self.chunk = None
+        used = self.count - self.chunks.index * self.chunk_frames
+        self.chunks.close(used * int(np.prod(self.frame_shape)))
+
+    def reserve(self, frame_number=None, timestamp=None):
+        """Index a new frame and return its writable slot in the chunk"""
+        if self.frame_shape is None:
+            raise ValueError("The frame shape is not known before the first write")
+        if self.chunk is None or self.count == (self.chunks.index + 1) * self.chunk_frames:
+            self._close_chunk()
+            self._open_chunk()
+        slot = self.chunk[self.count - self.chunks.index * self.chunk_frames]
+        record = np.array([(self.count if frame_number is None else frame_number,
+                            time.time() if timestamp is None else timestamp)], INDEX_DTYPE)
+        self.index.write(record.tobytes())
+        self.count += 1
+        return slot
+
+    def write(self, frame, frame_number=None, timestamp=None):
+        if self.frame_shape is None:
+            self._set_shape(frame.shape)
+        if frame.shape != self.frame_shape or frame.dtype != np.uint8:
+            raise ValueError(f"Frame of shape {frame.shape} ({frame.dtype}), the store holds {self.frame_shape} uint8")
+        self.reserve(frame_number, timestamp)[...] = frame
+
+    def release(self):
+        self._close_chunk()
+        self.index.close()
+
+
+class FrameStore:
+    """Read a frame store: store[i] is a read-only view of frame i in its mapped chunk, without copies"""
+
+    def __init__(self, store_dir):
+        with open(os.path.join(store_dir, METADATA_FILE)) as f:
+            metadata = json.load(f)
+        self.store_dir = store_dir
+        self.frame_shape = tuple(metadata["shape"])
+        self.chunk_frames = metadata["chunk_frames"]
+        self.index = np.fromfile(os.path.join(store_dir, INDEX_FILE), dtype=INDEX_DTYPE)
+        self.chunks = {}
+
+    def __len__(self):
+        return len(self.index)
+
+    @property
+    def frame_size(self):
+        """(width, height) of the frames"""
+        return self.frame_shape[1], self.frame_shape[0]
+
+    def _chunk(self, chunk_index):
+        if chunk_index not in self.chunks:
+            count = min(self.chunk_frames, len(self) - chunk_index * self.chunk_frames)
+            path = os.path.join(self.store_dir, CHUNK_PATTERN.format(chunk_index))
+            self.chunks[chunk_index] = np.memmap(path, dtype=np.uint8, mode="r", shape=(count,) + self.frame_shape)
+        return self.chunks[chunk_index]
+
+    def __getitem__(self, i):
+        if not -len(self) <= i < len(self):
+            raise IndexError(f"Frame {i} of a store of {len(self)} frames")
+        i %= len(self)
+        return self._chunk(i // self.chunk_frames)[i % self.chunk_frames]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def frames(self):
+        """Yield (frame_number, timestamp, frame) in stored order"""
+        for record, frame in zip(self.index, self):
+            yield int(record["frame_number"]), float(record["timestamp"]), frame
@@ -3,28 +3,58 @@
 import os
 import sys
 import ctypes
+import argparse
+import threading
+from functools import lru_cache
 import numpy as np
-import MvCameraControl_class as MvCC
 import cv2
 import time
 
+from metrics import Metrics, SUMMARY_INTERVAL
+from video_writers import open_writer
+from hikrobot_raw_recording import RawBayerWriter
+
 # Manually set the correct path to the Hikrobot DLLs
 sdk_runtime_path = r"C:\Program Files (x86)\Common Files\MVS\Runtime\Win64_x64"
+# Path of the MVS Camera Control class
+sdk_import_path = r"C:\Program Files\MVS\Development\Samples\Python\MvImport"
+
+# MVS Camera Control class, loaded by load_sdk
+MvCC = None
+
+
+def load_sdk(simulate=False):
+    """
+    Load the Hikrobot DLLs and import the MVS Camera Control class on first use, or the simulated
+    devices of hikrobot_mock_sdk
+    """
+    global MvCC
+    if MvCC is not None:
+        return MvCC
+
+    if simulate:
+        import hikrobot_mock_sdk
+        MvCC = hikrobot_mock_sdk
+        return MvCC
 
-if not os.path.exists(os.path.join(sdk_runtime_path, "MvCameraControl.dll")):
-    raise FileNotFoundError(f"Cannot find MvCameraControl.dll in {sdk_runtime_path}")
+    if not os.path.exists(os.path.join(sdk_runtime_path, "MvCameraControl.dll")):
+        raise FileNotFoundError(f"Cannot find MvCameraControl.dll in {sdk_runtime_path}")
 
-# Add DLL path to the environment
-os.environ["PATH"] += os.pathsep + sdk_runtime_path
+    # Add DLL path to the environment
+    os.environ["PATH"] += os.pathsep + sdk_runtime_path
 
-# Load the DLL manually
-MvCamCtrldll = ctypes.WinDLL(os.path.join(sdk_runtime_path, "MvCameraControl.dll"))
+    # Load the DLL manually
+    ctypes.WinDLL(os.path.join(sdk_runtime_path, "MvCameraControl.dll"))
 
-# Now import the MVS Camera Control class
-sys.path.append(r"C:\Program Files\MVS\Development\Samples\Python\MvImport")
+    # Now import the MVS Camera Control class
+    sys.path.append(sdk_import_path)
+    import MvCameraControl_class
+    MvCC = MvCameraControl_class
+    return MvCC
 
 
 IMAGE_RESIZE_FACTOR = 0.3
+BINNED_PREVIEW = True  # build the live view from 2x2 Bayer super-pixels instead of resizing the demosaiced frame
 CAMERA_SETTINGS = {
     "Width": None,
     "Height": None,
@@ -36,19 +66,30 @@ CAMERA_SETTINGS = {
     "TriggerMode": None,  # Trigger mode value (Off, On, etc.)
     "PixelFormat": None  # Pixel format value (Mono8, BayerBG8, etc.)
 }
+# Devices to open by enumeration index (None: all), and their settings overriding CAMERA_SETTINGS
+DEVICES = [0]
+DEVICE_SETTINGS = {}  # e.g. {1: {"ExposureTime": 20000}}
+FRAME_TIMEOUT_MS = 1000
+METRICS_ENABLED = True
 # width=1280, height=720, fps=30, exposure_time=20000, gain=10, brightness=100,
 # gamma=1.2, trigger_mode=0x8000, pixel_format=0x02100014
 RECORD_VIDEO = True
 OUTPUT_FILE = f"hikrobot_video_{time.strftime('%Y%m%d_%H%M%S', time.localtime())}.avi"
 DURATION = 4 #seconds
+# Video writer backend: "opencv" (cv2.VideoWriter) or "ffmpeg" (raw frames piped to an ffmpeg process)
+WRITER_BACKEND = "opencv"
+WRITER_OPTIONS = {}  # ffmpeg only, e.g. {"preset": "veryfast", "threads": 4}
+# Record the raw Bayer frames instead of a video, convert later with hikrobot_raw_recording.py
+RECORD_RAW = False
+RAW_OUTPUT_DIR = f"hikrobot_raw_{time.strftime('%Y%m%d_%H%M%S', time.localtime())}"
 
 
-def configure_hikrobot_camera(camera):
+def configure_hikrobot_camera(camera, settings=CAMERA_SETTINGS):
     """
     Adjusts the camera settings such as resolution, FPS, brightness, exposure, and gain.
     """
 
-    if all(value is None for value in CAMERA_SETTINGS.values()):
+    if all(value is None for value in settings.values()):
         print("No camera settings provided. Using default settings.")
         ret = camera.MV_CC_SetCommandValue("UserSetLoad")
         if ret != 0:
@@ -56,7 +97,7 @@ def configure_hikrobot_camera(camera):
         else:
             print("Factory settings restored successfully!")
 
-    for setting, value in CAMERA_SETTINGS.items():
+    for setting, value in settings.items():
         
         if value is None:
             continue
@@ -81,9 +122,89 @@ def configure_hikrobot_camera(camera):
     print("Custom settings loaded!")
     """
 
-# Function to process video frames in real-time
-def main(duration=DURATION):
-    # --Control Camera
+
+@lru_cache(maxsize=None)
+def bayer_layout(conversion=cv2.COLOR_BAYER_RG2RGB):
+    """
+    (row, column) offsets in each 2x2 Bayer cell of the samples that the conversion puts in output
+    channels 0, 1 (the two greens) and 2, found by demosaicing one lit cell position at a time
+    """
+    channels = {}
+    for dy in (0, 1):
+        for dx in (0, 1):
+            mosaic = np.zeros((8, 8), np.uint8)
+            mosaic[dy::2, dx::2] = 255
+            channel = int(np.argmax(cv2.cvtColor(mosaic, conversion)[4 + dy, 4 + dx]))
+            channels.setdefault(channel, []).append((dy, dx))
+    return channels[0][0], channels[1], channels[2][0]
+
+
+def binned_preview(bayer_image, factor=IMAGE_RESIZE_FACTOR, conversion=cv2.COLOR_BAYER_RG2RGB):
+    """
+    Downscaled color preview straight from a Bayer mosaic: every step-th 2x2 cell becomes one pixel
+    (its two greens averaged), with step the even cell spacing closest to 1/factor, and the small result
+    is resized to the size cv2.resize(..., fx=factor, fy=factor) of the demosaiced frame would have.
+    Channels are ordered as the conversion orders them.
+    """
+    first, (green_1, green_2), last = bayer_layout(conversion)
+    step = 2 * max(round(0.5 / factor), 1)
+    height, width = bayer_image.shape[:2]
+    rows, cols = (height - 1) // step, (width - 1) // step
+
+    def pick(offset):
+        # Nearest-neighbour resize by an exact integer ratio samples one position of each picked cell
+        dy, dx = offset
+        return cv2.resize(bayer_image[dy:dy + rows * step, dx:dx + cols * step], (cols, rows),
+                          interpolation=cv2.INTER_NEAREST)
+
+    preview = cv2.merge([pick(first), cv2.addWeighted(pick(green_1), 0.5, pick(green_2), 0.5, 0), pick(last)])
+    size = (round(width * factor), round(height * factor))
+    if (cols, rows) != size:
+        preview = cv2.resize(preview, size, interpolation=cv2.INTER_LINEAR)
+    return preview
+
+
+def benchmark_preview(factor=IMAGE_RESIZE_FACTOR, repeats=20):
+    """Compare the binned preview with demosaic + resize on synthetic mosaics of common sensor sizes"""
+    first, greens, last = bayer_layout(cv2.COLOR_BAYER_RG2RGB)
+    rng = np.random.default_rng(0)
+    for height, width in [(1080, 1440), (2048, 2448), (3036, 4024)]:
+        # Smooth color gradients with some texture, sampled on the Bayer pattern
+        y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+        image = np.dstack([255 * x / width, 255 * y / height, 127 + 100 * np.sin(x / 40) * np.cos(y / 30)])
+        image = np.clip(image + rng.normal(0, 4, image.shape), 0, 255).astype(np.uint8)
+        mosaic = np.empty((height, width), np.uint8)
+        for channel, offsets in ((0, [first]), (1, greens), (2, [last])):
+            for dy, dx in offsets:
+                mosaic[dy::2, dx::2] = image[dy::2, dx::2, channel]
+
+        def full():
+            frame = cv2.cvtColor(mosaic, cv2.COLOR_BAYER_RG2RGB)
+            return cv2.resize(frame, (0, 0), fx=factor, fy=factor)
+
+        timings = {}
+        for name, preview in (("demosaic+resize", full), ("binned", lambda: binned_preview(mosaic, factor))):
+            preview()
+            start = time.perf_counter()
+            for _ in range(repeats):
+                result = preview()
+            timings[name] = ((time.perf_counter() - start) / repeats * 1000, result)
+        (full_ms, reference), (binned_ms, binned) = timings.values()
+        difference = np.abs(reference.astype(np.int16) - binned).mean()
+        print(f"{width}x{height}: demosaic+resize {full_ms:.2f} ms, binned {binned_ms:.2f} ms "
+              f"({full_ms / binned_ms:.1f}x), mean difference {difference:.2f} gray levels")
+
+
+def device_output(path, index, multiple):
+    """Output file or directory of a device, suffixed with its index when several devices record"""
+    if not multiple:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}_dev{index}{ext}"
+
+
+def enumerate_devices():
+    """Device infos of the connected GigE and USB cameras"""
     # Create a device list
     pstDevList = MvCC.MV_CC_DEVICE_INFO_LIST()
     nTLayerType = MvCC.MV_GIGE_DEVICE | MvCC.MV_USB_DEVICE
@@ -93,131 +214,275 @@ def main(duration=DURATION):
     if ret != 0 or pstDevList.nDeviceNum == 0:
         print("No camera is available:", ret, pstDevList.nDeviceNum)
         sys.exit()
+    return [ctypes.cast(pstDevList.pDeviceInfo[nDeviceIndex], ctypes.POINTER(MvCC.MV_CC_DEVICE_INFO)).contents
+            for nDeviceIndex in range(pstDevList.nDeviceNum)]
 
-    # Choose the first camera
-    nDeviceIndex = 0
-    stDevInfo = ctypes.cast(pstDevList.pDeviceInfo[nDeviceIndex], ctypes.POINTER(MvCC.MV_CC_DEVICE_INFO)).contents
 
-    # Create camera handle
+def open_camera(stDevInfo, settings):
+    """Create the camera handle, open the device, apply its settings and start grabbing; None on failure"""
     camera = MvCC.MvCamera()
     ret = camera.MV_CC_CreateHandle(stDevInfo)
     if ret != 0:
         print("create handle fail! ret[0x%x]" % ret)
-        sys.exit()
+        return None
 
     # Open device and start grabbing
     ret = camera.MV_CC_OpenDevice(MvCC.MV_ACCESS_Exclusive, 0)
     if ret != 0:
         print("open device fail! ret[0x%x]" % ret)
-        sys.exit()
+        camera.MV_CC_DestroyHandle()
+        return None
 
     # Configure camera settings
-    configure_hikrobot_camera(camera)
+    configure_hikrobot_camera(camera, settings)
 
     ret = camera.MV_CC_StartGrabbing()
     if ret != 0:
         print("start grabbing fail! ret[0x%x]" % ret)
-        sys.exit()
-    # --Control Camera
+        camera.MV_CC_CloseDevice()
+        camera.MV_CC_DestroyHandle()
+        return None
+    return camera
 
-    if RECORD_VIDEO:
-        # Define the codec and create VideoWriter object
-        fourcc = cv2.VideoWriter_fourcc(*'MJPG')
 
-        # Create instances to store the retrieved values
-        stFloatValue = MvCC.MVCC_FLOATVALUE()
-        stIntValue = MvCC.MVCC_INTVALUE()
+def open_video_writer(camera, output_file):
+    """Video writer at the camera's frame rate and resolution; None on failure"""
+    # Create instances to store the retrieved values
+    stFloatValue = MvCC.MVCC_FLOATVALUE()
+    stIntValue = MvCC.MVCC_INTVALUE()
 
-        # Retrieve the frame rate, width, and height
-        ret = camera.MV_CC_GetFloatValue("AcquisitionFrameRate", stFloatValue)
-        if ret != 0:
-            print("Failed to get frame rate! ret[0x%x]" % ret)
-            sys.exit()
-        fps = stFloatValue.fCurValue
+    # Retrieve the frame rate, width, and height
+    ret = camera.MV_CC_GetFloatValue("AcquisitionFrameRate", stFloatValue)
+    if ret != 0:
+        print("Failed to get frame rate! ret[0x%x]" % ret)
+        return None
+    fps = stFloatValue.fCurValue
 
-        ret = camera.MV_CC_GetIntValue("Width", stIntValue)
-        if ret != 0:
-            print("Failed to get frame width! ret[0x%x]" % ret)
-            sys.exit()
-        frame_width = stIntValue.nCurValue
+    ret = camera.MV_CC_GetIntValue("Width", stIntValue)
+    if ret != 0:
+        print("Failed to get frame width! ret[0x%x]" % ret)
+        return None
+    frame_width = stIntValue.nCurValue
 
-        ret = camera.MV_CC_GetIntValue("Height", stIntValue)
-        if ret != 0:
-            print("Failed to get frame height! ret[0x%x]" % ret)
-            sys.exit()
-        frame_height = stIntValue.nCurValue
-
-        # Ensure fps is valid
-        if fps < 1:
-            print("Invalid frame rate! fps must be >= 1")
-            sys.exit()
-
-        out = cv2.VideoWriter(OUTPUT_FILE, fourcc, fps, (frame_width, frame_height))
-        print(f"Recording video for {duration} seconds...")
-        start_time = time.time()
-  
-    frame_index = 0
-
-    if not RECORD_VIDEO:
-        start_time = 0
-        DURATION = np.inf
-     
-    while time.time() - start_time < duration:
+    ret = camera.MV_CC_GetIntValue("Height", stIntValue)
+    if ret != 0:
+        print("Failed to get frame height! ret[0x%x]" % ret)
+        return None
+    frame_height = stIntValue.nCurValue
+
+    # Ensure fps is valid
+    if fps < 1:
+        print("Invalid frame rate! fps must be >= 1")
+        return None
+
+    # Create the video writer with the MJPG codec
+    return open_writer(output_file, fps, (frame_width, frame_height), WRITER_BACKEND, 'MJPG', **WRITER_OPTIONS)
+
+
+class DeviceAcquisition(threading.Thread):
+    """
+    Acquire one camera on its own thread, with its own frame buffer, recorder and preview. Frames lost
+    by the camera or the transport are counted from the gaps in the camera's frame numbers.
+    """
+
+    def __init__(self, index, camera, stop_event, output_file=None, raw_output_dir=None):
+        super().__init__(name=f"hikrobot-{index}", daemon=True)
+        self.index = index
+        self.camera = camera
+        self.stop_event = stop_event
+        self.output_file = output_file
+        self.raw_writer = RawBayerWriter(raw_output_dir) if raw_output_dir else None
+        self.video_writer = None
+        self.buffer = np.empty(0, np.uint8)
+        self.preview = None         # latest preview image, shown by the main thread
+        self.last_frame_number = None
+        self.metrics = Metrics(f"hikrobot {index}", METRICS_ENABLED)
+        self.frames = 0
+        self.dropped = 0
+        self.failed = False
+
+    def run(self):
+        try:
+            if self.output_file is not None:
+                self.video_writer = open_video_writer(self.camera, self.output_file)
+                if self.video_writer is None:
+                    self.failed = True
+                    return
+            while not self.stop_event.is_set():
+                self.acquire()
+        finally:
+            if self.video_writer is not None:
+                self.video_writer.release()
+            if self.raw_writer is not None:
+                self.raw_writer.release()
+
+    def acquire(self):
+        """Grab, record and preview one frame"""
         # --Capture Frame
         # Create an empty container for image data and information
         stOutFrame = MvCC.MV_FRAME_OUT()
         ctypes.memset(ctypes.byref(stOutFrame), 0, ctypes.sizeof(stOutFrame))
-        
+
         # Get one frame of image
-        ret = camera.MV_CC_GetImageBuffer(stFrame=stOutFrame, nMsec=10000)
+        with self.metrics.timer("grab"):
+            ret = self.camera.MV_CC_GetImageBuffer(stFrame=stOutFrame, nMsec=FRAME_TIMEOUT_MS)
 
         # Process the captured frame
         if ret != 0:
-            print("No Image is captured[0x%x]" % ret)
-            continue  # Skip the current iteration if no image is captured
+            print(f"Device {self.index}: No Image is captured[0x{ret:x}]")
+            self.metrics.count("timeouts")
+            return  # Skip the current iteration if no image is captured
+
+        stFrameInfo = stOutFrame.stFrameInfo
+        with self.metrics.timer("copy"):
+            if self.raw_writer is not None:
+                # Copy the raw image buffer straight into the memory-mapped recording
+                buf_cache = self.raw_writer.reserve(
+                    stFrameInfo.nFrameLen, stFrameInfo.nWidth, stFrameInfo.nHeight, stFrameInfo.enPixelType,
+                    time.time(), stFrameInfo.nFrameNum,
+                    (stFrameInfo.nDevTimeStampHigh << 32) | stFrameInfo.nDevTimeStampLow)
+            else:
+                # Copy the raw image buffer into the buffer of this device, reused across frames
+                if len(self.buffer) != stFrameInfo.nFrameLen:
+                    self.buffer = np.empty(stFrameInfo.nFrameLen, np.uint8)
+                buf_cache = self.buffer
+            ctypes.memmove(buf_cache.ctypes.data, stOutFrame.pBufAddr, stFrameInfo.nFrameLen)
+
+        # Free the image buffer, the SDK can fill it again
+        self.camera.MV_CC_FreeImageBuffer(stOutFrame)
+        # --Capture Frame
 
-        if stOutFrame.pBufAddr is not None:
-            # Copy the raw image buffer
-            buf_cache = (ctypes.c_ubyte * stOutFrame.stFrameInfo.nFrameLen)()
-            ctypes.memmove(ctypes.byref(buf_cache), stOutFrame.pBufAddr, stOutFrame.stFrameInfo.nFrameLen)
+        # Frames the camera numbered but never delivered
+        if self.last_frame_number is not None and stFrameInfo.nFrameNum > self.last_frame_number + 1:
+            lost = stFrameInfo.nFrameNum - self.last_frame_number - 1
+            self.dropped += lost
+            self.metrics.count("dropped", lost)
+        self.last_frame_number = stFrameInfo.nFrameNum
 
-            # Convert buffer to a NumPy array
-            bayer_image = np.frombuffer(buf_cache, dtype=np.uint8).reshape(
-                (stOutFrame.stFrameInfo.nHeight, stOutFrame.stFrameInfo.nWidth))
+        # Convert buffer to a NumPy array
+        bayer_image = buf_cache.reshape((stFrameInfo.nHeight, stFrameInfo.nWidth))
 
+        # Only the recorder needs the full-resolution frame when the preview is binned
+        if self.video_writer is not None or not BINNED_PREVIEW:
             # Demosaicing using OpenCV
             frame = cv2.cvtColor(bayer_image, cv2.COLOR_BAYER_RG2RGB)
 
-            # Resize the image
-            result_nparray = cv2.resize(frame, (0, 0), fx=IMAGE_RESIZE_FACTOR, fy=IMAGE_RESIZE_FACTOR)
+        with self.metrics.timer("preview"):
+            if BINNED_PREVIEW:
+                # Downscaled preview straight from the Bayer mosaic
+                self.preview = binned_preview(bayer_image, IMAGE_RESIZE_FACTOR)
+            else:
+                # Resize the image
+                self.preview = cv2.resize(frame, (0, 0), fx=IMAGE_RESIZE_FACTOR, fy=IMAGE_RESIZE_FACTOR)
 
-            if RECORD_VIDEO:
-                # Write frame to video
-                out.write(frame)
+        if self.video_writer is not None:
+            # Write frame to video
+            with self.metrics.timer("write"):
+                self.video_writer.write(frame)
 
-            # Increment frame index
-            frame_index += 1
+        self.frames += 1
+        self.metrics.count("frames")
+        self.metrics.tick()
 
-            # Display the resized image using OpenCV
-            cv2.imshow('Camera Feed', result_nparray)
 
-            # Exit on 'q' key
-            if cv2.waitKey(1) & 0xFF == ord('q'):
-                break
+def print_aggregate(acquisitions, elapsed):
+    """One line with the total and per-device frame rates and drops"""
+    total_frames = sum(acquisition.frames for acquisition in acquisitions)
+    total_dropped = sum(acquisition.dropped for acquisition in acquisitions)
+    devices = " | ".join(f"dev{acquisition.index} {acquisition.frames / elapsed:.1f} fps, "
+                         f"{acquisition.dropped} dropped" for acquisition in acquisitions)
+    print(f"[hikrobot] {len(acquisitions)} devices {total_frames / elapsed:.1f} fps, "
+          f"{total_dropped} dropped | {devices}")
 
-            # Free the image buffer
-            camera.MV_CC_FreeImageBuffer(stOutFrame)
-            # --Capture Frame
 
-    # Stop grabbing and clean up
-    camera.MV_CC_StopGrabbing()
-    camera.MV_CC_CloseDevice()
-    camera.MV_CC_DestroyHandle()
-    cv2.destroyAllWindows()
+# Function to process video frames in real-time
+def main(duration=DURATION, devices=DEVICES, simulate=False, show=True):
+    load_sdk(simulate)
+
+    # --Control Camera
+    device_infos = enumerate_devices()
+    indices = range(len(device_infos)) if devices is None else [i for i in devices if i < len(device_infos)]
+    if not indices:
+        print(f"None of the devices {devices} is available, {len(device_infos)} found")
+        sys.exit()
+
+    stop_event = threading.Event()
+    acquisitions = []
+    multiple = len(indices) > 1
+    for index in indices:
+        # Open every device with the common settings and its own overrides
+        camera = open_camera(device_infos[index], {**CAMERA_SETTINGS, **DEVICE_SETTINGS.get(index, {})})
+        if camera is None:
+            continue
+        output_file = device_output(OUTPUT_FILE, index, multiple) if RECORD_VIDEO and not RECORD_RAW else None
+        raw_output_dir = device_output(RAW_OUTPUT_DIR, index, multiple) if RECORD_VIDEO and RECORD_RAW else None
+        acquisitions.append(DeviceAcquisition(index, camera, stop_event, output_file, raw_output_dir))
+    # --Control Camera
+    if not acquisitions:
+        sys.exit()
+
     if RECORD_VIDEO:
-        out.release()
-        print(f"Recording complete! Video saved as {OUTPUT_FILE}!")
+        print(f"Recording {len(acquisitions)} devices for {duration} seconds...")
+    else:
+        # Preview until 'q' is pressed
+        duration = np.inf
+    start_time = last_summary = time.time()
+    for acquisition in acquisitions:
+        acquisition.start()
+
+    shown = {}
+    while time.time() - start_time < duration and any(acquisition.is_alive() for acquisition in acquisitions):
+        if show:
+            # Display the resized images using OpenCV, from the main thread
+            for acquisition in acquisitions:
+                preview = acquisition.preview
+                if preview is not None and shown.get(acquisition.index) is not preview:
+                    cv2.imshow(f'Camera Feed {acquisition.index}', preview)
+                    shown[acquisition.index] = preview
+
+            # Exit on 'q' key
+            if cv2.waitKey(1) & 0xFF == ord('q'):
+                break
+        else:
+            time.sleep(0.01)
+        if time.time() - last_summary >= SUMMARY_INTERVAL:
+            print_aggregate(acquisitions, time.time() - start_time)
+            last_summary = time.time()
+
+    # Stop the acquisition threads, then grabbing, and clean up
+    stop_event.set()
+    for acquisition in acquisitions:
+        acquisition.join()
+        acquisition.metrics.summary()
+        acquisition.camera.MV_CC_StopGrabbing()
+        acquisition.camera.MV_CC_CloseDevice()
+        acquisition.camera.MV_CC_DestroyHandle()
+    print_aggregate(acquisitions, time.time() - start_time)
+    if show:
+        cv2.destroyAllWindows()
+    for acquisition in acquisitions:
+        if acquisition.failed:
+            print(f"Device {acquisition.index} could not record")
+        elif acquisition.raw_writer is not None:
+            print(f"Recording complete! {acquisition.raw_writer.frame_count} raw frames saved in "
+                  f"{acquisition.raw_writer.output_dir}!")
+        elif acquisition.output_file is not None:
+            print(f"Recording complete! Video saved as {acquisition.output_file}!")
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--duration', type=float, help='Recording duration in seconds', default=DURATION)
+    parser.add_argument('--devices', type=int, nargs='*', default=DEVICES,
+                        help='Indices of the devices to open (all when given without indices)')
+    parser.add_argument('--simulate', type=int, default=0, help='Use this many simulated devices instead of cameras')
+    parser.add_argument('--no_show', action='store_true', help='Do not open the live view windows')
+    parser.add_argument('--benchmark', action='store_true', help='Compare the preview paths on synthetic mosaics')
+    opt = parser.parse_args()
+    if opt.benchmark:
+        benchmark_preview()
+    else:
+        if opt.simulate:
+            import hikrobot_mock_sdk
+            hikrobot_mock_sdk.SIMULATED_DEVICES = opt.simulate
+        main(opt.duration, opt.devices or None, opt.simulate > 0, not opt.no_show)
@@ -0,0 +1,233 @@
+"""Simulated Hikrobot cameras behind the subset of the MVS MvCameraControl_class API used by the scripts."""
+
+import time
+import ctypes
+import numpy as np
+
+
+# Simulated devices
+SIMULATED_DEVICES = 2
+WIDTH, HEIGHT = 1440, 1080
+FRAME_RATE = 30.0
+PIXEL_FORMAT = 0x01080009   # BayerRG8
+PATTERN_FRAMES = 8          # distinct frames each device cycles through
+DROP_EVERY = 0              # also lose one frame in every DROP_EVERY (0: only when the reader falls behind)
+
+MV_GIGE_DEVICE = 0x00000001
+MV_USB_DEVICE = 0x00000004
+MV_ACCESS_Exclusive = 1
+MV_MAX_DEVICE_NUM = 256
+
+MV_OK = 0
+MV_E_HANDLE = 0x80000000
+MV_E_CALLORDER = 0x80000003
+MV_E_PARAMETER = 0x80000004
+MV_E_NODATA = 0x80000007
+
+
+class MV_CC_DEVICE_INFO(ctypes.Structure):
+    _fields_ = [("nMajorVer", ctypes.c_ushort),
+                ("nMinorVer", ctypes.c_ushort),
+                ("nMacAddrHigh", ctypes.c_uint),
+                ("nMacAddrLow", ctypes.c_uint),
+                ("nTLayerType", ctypes.c_uint),
+                ("nDeviceIndex", ctypes.c_uint)]
+
+
+class MV_CC_DEVICE_INFO_LIST(ctypes.Structure):
+    _fields_ = [("nDeviceNum", ctypes.c_uint),
+                ("pDeviceInfo", ctypes.POINTER(MV_CC_DEVICE_INFO) * MV_MAX_DEVICE_NUM)]
+
+
+class MV_FRAME_OUT_INFO_EX(ctypes.Structure):
+    _fields_ = [("nWidth", ctypes.c_ushort),
+                ("nHeight", ctypes.c_ushort),
+                ("enPixelType", ctypes.c_uint),
+                ("nFrameNum", ctypes.c_uint),
+                ("nDevTimeStampHigh", ctypes.c_uint),
+                ("nDevTimeStampLow", ctypes.c_uint),
+                ("nReserved0", ctypes.c_uint),
+                ("nHostTimeStamp", ctypes.c_int64),
+                ("nFrameLen", ctypes.c_uint)]
+
+
+class MV_FRAME_OUT(ctypes.Structure):
+    _fields_ = [("pBufAddr", ctypes.POINTER(ctypes.c_ubyte)),
+                ("stFrameInfo", MV_FRAME_OUT_INFO_EX),
+                ("nRes", ctypes.c_uint * 16)]
+
+
+class MVCC_INTVALUE(ctypes.Structure):
+    _fields_ = [("nCurValue", ctypes.c_uint),
+                ("nMax", ctypes.c_uint),
+                ("nMin", ctypes.c_uint),
+                ("nInc", ctypes.c_uint),
+                ("nReserved", ctypes.c_uint * 4)]
+
+
+class MVCC_FLOATVALUE(ctypes.Structure):
+    _fields_ = [("fCurValue", ctypes.c_float),
+                ("fMax", ctypes.c_float),
+                ("fMin", ctypes.c_float),
+                ("nReserved", ctypes.c_uint * 4)]
+
+
+def _default_settings():
+    return {"Width": WIDTH, "Height": HEIGHT, "AcquisitionFrameRate": FRAME_RATE, "ExposureTime": 10000.0,
+            "Gain": 0.0, "Brightness": 100, "Gamma": 1.0, "TriggerMode": 0, "PixelFormat": PIXEL_FORMAT}
+
+
+class SimulatedDevice:
+    """One simulated camera: its settings and a few Bayer frames of a moving color pattern"""
+
+    def __init__(self, index):
+        self.index = index
+        self.settings = _default_settings()
+        self.frames = None
+        self.open = False
+
+    def render(self):
+        """Bayer mosaics (RGGB) of a gradient scrolling at a per-device speed, drawn once per size"""
+        width, height = self.settings["Width"], self.settings["Height"]
+        y, x = np.mgrid[0:height, 0:width]
+        self.frames = []
+        for n in range(PATTERN_FRAMES):
+            shift = n * 8 * (self.index + 1)
+            image = np.dstack([(x + shift) % 256, (y + shift) % 256, (x + y) // 2 % 256]).astype(np.uint8)
+            mosaic = np.empty((height, width), np.uint8)
+            mosaic[0::2, 0::2] = image[0::2, 0::2, 0]
+            mosaic[0::2, 1::2] = image[0::2, 1::2, 1]
+            mosaic[1::2, 0::2] = image[1::2, 0::2, 1]
+            mosaic[1::2, 1::2] = image[1::2, 1::2, 2]
+            self.frames.append(mosaic)
+
+
+_devices = [SimulatedDevice(index) for index in range(SIMULATED_DEVICES)]
+
+
+class MvCamera:
+    """Camera handle with the MvCamera methods the scripts call"""
+
+    def __init__(self):
+        self.device = None
+        self.grabbing = False
+
+    @staticmethod
+    def MV_CC_EnumDevices(nTLayerType, stDevList):
+        # The device list follows SIMULATED_DEVICES, which may be changed before enumerating
+        while len(_devices) < SIMULATED_DEVICES:
+            _devices.append(SimulatedDevice(len(_devices)))
+        del _devices[SIMULATED_DEVICES:]
+        MvCamera._infos = [MV_CC_DEVICE_INFO(nTLayerType=MV_GIGE_DEVICE, nDeviceIndex=index)
+                           for index in range(len(_devices))]
+        stDevList.nDeviceNum = len(_devices) if nTLayerType & (MV_GIGE_DEVICE | MV_USB_DEVICE) else 0
+        for index, info in enumerate(MvCamera._infos):
+            stDevList.pDeviceInfo[index] = ctypes.pointer(info)
+        return MV_OK
+
+    def MV_CC_CreateHandle(self, stDevInfo):
+        if stDevInfo.nDeviceIndex >= len(_devices):
+            return MV_E_PARAMETER
+        self.device = _devices[stDevInfo.nDeviceIndex]
+        return MV_OK
+
+    def MV_CC_OpenDevice(self, nAccessMode=MV_ACCESS_Exclusive, nSwitchoverKey=0):
+        if self.device is None:
+            return MV_E_HANDLE
+        if self.device.open:
+            return MV_E_CALLORDER
+        self.device.open = True
+        return MV_OK
+
+    def _set(self, setting, value, kind):
+        if self.device is None:
+            return MV_E_HANDLE
+        if setting not in self.device.settings or not isinstance(value, kind):
+            return MV_E_PARAMETER
+        self.device.settings[setting] = value
+        self.device.frames = None
+        return MV_OK
+
+    def MV_CC_SetIntValue(self, strKey, nValue):
+        return self._set(strKey, nValue, int)
+
+    def MV_CC_SetFloatValue(self, strKey, fValue):
+        return self._set(strKey, fValue, float)
+
+    def MV_CC_SetEnumValue(self, strKey, nValue):
+        return self._set(strKey, nValue, int)
+
+    def MV_CC_SetCommandValue(self, strCommand):
+        if self.device is None:
+            return MV_E_HANDLE
+        if strCommand == "UserSetLoad":
+            self.device.settings = _default_settings()
+            self.device.frames = None
+        return MV_OK
+
+    def MV_CC_GetIntValue(self, strKey, stIntValue):
+        if self.device is None:
+            return MV_E_HANDLE
+        stIntValue.nCurValue = int(self.device.settings[strKey])
+        return MV_OK
+
+    def MV_CC_GetFloatValue(self, strKey, stFloatValue):
+        if self.device is None:
+            return MV_E_HANDLE
+        stFloatValue.fCurValue = float(self.device.settings[strKey])
+        return MV_OK
+
+    def MV_CC_StartGrabbing(self):
+        if self.device is None or not self.device.open:
+            return MV_E_CALLORDER
+        if self.device.frames is None:
+            self.device.render()
+        self.grabbing = True
+        self.start_time = time.perf_counter()
+        self.frame_number = -1
+        return MV_OK
+
+    def MV_CC_GetImageBuffer(self, stFrame, nMsec):
+        """Wait for the next frame period; frames whose period passed while nobody asked are lost"""
+        if not self.grabbing:
+            return MV_E_CALLORDER
+        fps = float(self.device.settings["AcquisitionFrameRate"])
+        now = time.perf_counter()
+        frame_number = max(self.frame_number + 1, int((now - self.start_time) * fps))
+        if DROP_EVERY and frame_number % DROP_EVERY == DROP_EVERY - 1:
+            frame_number += 1
+        due = self.start_time + frame_number / fps
+        if due - now > nMsec / 1000:
+            time.sleep(nMsec / 1000)
+            return MV_E_NODATA
+        if due > now:
+            time.sleep(due - now)
+        self.frame_number = frame_number
+
+        mosaic = self.device.frames[frame_number % PATTERN_FRAMES]
+        ticks = int(due * 1e8)      # 100 MHz device clock
+        stFrame.pBufAddr = mosaic.ctypes.data_as(ctypes.POINTER(ctypes.c_ubyte))
+        info = stFrame.stFrameInfo
+        info.nWidth, info.nHeight = mosaic.shape[1], mosaic.shape[0]
+        info.enPixelType = self.device.settings["PixelFormat"]
+        info.nFrameNum = frame_number
+        info.nDevTimeStampHigh, info.nDevTimeStampLow = ticks >> 32, ticks & 0xFFFFFFFF
+        info.nHostTimeStamp = int(time.time() * 1000)
+        info.nFrameLen = mosaic.nbytes
+        return MV_OK
+
+    def MV_CC_FreeImageBuffer(self, stFrame):
+        return MV_OK
+
+    def MV_CC_StopGrabbing(self):
+        self.grabbing = False
+        return MV_OK
+
+    def MV_CC_CloseDevice(self):
+        if self.device is not None:
+            self.device.open = False
+        return MV_OK
+
+    def MV_CC_DestroyHandle(self):
+        self.device = None
+        return MV_OK
@@ -0,0 +1,196 @@
+"""Record raw Bayer frames of a Hikrobot camera to chunked memory-mapped files and convert them offline."""
+
+import os
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import cv2
+
+from video_writers import open_writer, add_writer_arguments, writer_options
+from video_timestamps import open_timestamps
+from memmap_chunks import ChunkFiles, find_chunks
+
+
+CHUNK_BYTES = 1 << 30       # preallocated size of each chunk file
+CHUNK_PATTERN = "chunk_{:05d}.bayer"
+ALIGNMENT = 64              # frame records start on cache-line boundaries
+MAGIC = b"BAYR"
+
+# Per-frame header, followed by the raw frame bytes padded to ALIGNMENT
+HEADER_DTYPE = np.dtype([("magic", "S4"),
+                         ("size", "<u4"),                # bytes of the raw frame
+                         ("width", "<u2"),
+                         ("height", "<u2"),
+                         ("pixel_format", "<u4"),        # MVS PixelType_Gvsp_* value
+                         ("frame_number", "<u4"),        # camera frame counter
+                         ("device_timestamp", "<u8"),    # camera clock ticks
+                         ("timestamp", "<f8"),           # host time (seconds since the epoch)
+                         ("reserved", "V28")])
+HEADER_SIZE = HEADER_DTYPE.itemsize
+
+# MVS pixel formats -> OpenCV demosaicing, matching the COLOR_BAYER_RG2RGB of the live view
+MONO8 = 0x01080001
+BAYER_CONVERSIONS = {
+    0x01080008: cv2.COLOR_BAYER_GR2RGB,     # BayerGR8
+    0x01080009: cv2.COLOR_BAYER_RG2RGB,     # BayerRG8
+    0x0108000A: cv2.COLOR_BAYER_GB2RGB,     # BayerGB8
+    0x0108000B: cv2.COLOR_BAYER_BG2RGB,     # BayerBG8
+}
+HIGH_BIT_SHIFT = 4          # 12-bit formats (stored in 16 bits) to 8 bits for encoding
+VIDEO_TYPE = 'avi'
+CODEC = 'MJPG'
+
+
+def _aligned(size):
+    return (size + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+class RawBayerWriter:
+    """
+    Append raw frames, each after a HEADER_DTYPE header, to chunk files of chunk_bytes that are
+    preallocated and memory-mapped, so recording is a single memmove from the SDK buffer into the
+    page cache. A finished chunk is truncated to the bytes it holds.
+    """
+
+    def __init__(self, output_dir, chunk_bytes=CHUNK_BYTES):
+        self.output_dir = output_dir
+        self.chunk_bytes = chunk_bytes
+        self.chunks = ChunkFiles(output_dir, CHUNK_PATTERN, chunk_bytes)
+        self.chunk = None
+        self.offset = 0
+        self.frame_count = 0
+
+    def _next_chunk(self):
+        self._close_chunk()
+        self.chunk = self.chunks.open()
+        self.offset = 0
+
+    def _close_chunk(self):
+        self.chunks.close(self.offset)
+        self.chunk = None
+
+    def reserve(self, size, width, height, pixel_format, timestamp=None, frame_number=0, device_timestamp=0):
+        """Write the header of a frame and return the writable bytes of its payload in the chunk"""
+        record_bytes = HEADER_SIZE + _aligned(size)
+        if record_bytes > self.chunk_bytes:
+            raise ValueError(f"A frame of {size} bytes does not fit in chunks of {self.chunk_bytes} bytes")
+        if self.chunk is None or self.offset + record_bytes > self.chunk_bytes:
+            self._next_chunk()
+        header = self.chunk[self.offset:self.offset + HEADER_SIZE].view(HEADER_DTYPE)[0]
+        header["magic"], header["size"] = MAGIC, size
+        header["width"], header["height"], header["pixel_format"] = width, height, pixel_format
+        header["frame_number"], header["device_timestamp"] = frame_number, device_timestamp
+        header["timestamp"] = time.time() if timestamp is None else timestamp
+        payload = self.chunk[self.offset + HEADER_SIZE:self.offset + HEADER_SIZE + size]
+        self.offset += record_bytes
+        self.frame_count += 1
+        return payload
+
+    def write(self, frame, pixel_format, timestamp=None, frame_number=0, device_timestamp=0):
+        """Append a 2D raw frame array"""
+        height, width = frame.shape[:2]
+        payload = self.reserve(frame.nbytes, width, height, pixel_format, timestamp, frame_number, device_timestamp)
+        payload[:] = np.ascontiguousarray(frame).reshape(-1).view(np.uint8)
+
+    def release(self):
+        self._close_chunk()
+
+
+def chunk_paths(recording_dir):
+    return find_chunks(recording_dir, CHUNK_PATTERN)
+
+
+def read_chunk(path):
+    """Yield (header, frame) for each frame of a chunk file, frames are read-only views of the mapped file"""
+    if os.path.getsize(path) == 0:
+        return
+    chunk = np.memmap(path, dtype=np.uint8, mode="r")
+    offset = 0
+    while offset + HEADER_SIZE <= len(chunk):
+        header = chunk[offset:offset + HEADER_SIZE].view(HEADER_DTYPE)[0]
+        # A chunk left untruncated by an interrupted recording ends with zeros
+        if header["magic"] != MAGIC:
+            break
+        size, width, height = int(header["size"]), int(header["width"]), int(header["height"])
+        if offset + HEADER_SIZE + size > len(chunk):
+            break
+        payload = chunk[offset + HEADER_SIZE:offset + HEADER_SIZE + size]
+        # 8-bit formats, or unpacked 10/12-bit formats stored in 16 bits
+        dtype = np.uint8 if size == width * height else np.uint16
+        yield header, payload.view(dtype).reshape(height, width)
+        offset += HEADER_SIZE + _aligned(size)
+
+
+def read_raw_frames(recording_dir):
+    """Yield (header, frame) for every frame of a recording, in order"""
+    for path in chunk_paths(recording_dir):
+        yield from read_chunk(path)
+
+
+def demosaic(frame, pixel_format):
+    """Color image of a raw frame, with the same conversion as the live view"""
+    if pixel_format == MONO8:
+        return cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+    return cv2.cvtColor(frame, BAYER_CONVERSIONS.get(pixel_format, cv2.COLOR_BAYER_RG2RGB))
+
+
+def estimate_fps(recording_dir):
+    """Frame rate from the median interval of the host timestamps"""
+    timestamps = [header["timestamp"] for header, _ in read_raw_frames(recording_dir)]
+    if len(timestamps) < 2:
+        return 30
+    return float(1 / np.median(np.diff(timestamps)))
+
+
+def _convert_chunk(job):
+    """Worker: demosaic and encode one chunk to its own video segment with a timestamps sidecar"""
+    chunk_path, output_dir, fps, backend, options = job
+    name = os.path.splitext(os.path.basename(chunk_path))[0]
+    video_path = os.path.join(output_dir, f"{name}.{VIDEO_TYPE}")
+    writer = None
+    count = 0
+    with open_timestamps(video_path) as sidecar:
+        for header, frame in read_chunk(chunk_path):
+            image = demosaic(frame, int(header["pixel_format"]))
+            if image.dtype != np.uint8:
+                image = (image >> HIGH_BIT_SHIFT).astype(np.uint8)
+            if writer is None:
+                writer = open_writer(video_path, fps, (image.shape[1], image.shape[0]), backend, CODEC, **options)
+            writer.write(image)
+            sidecar.write(f"{count},{header['timestamp']:.6f}\n")
+            count += 1
+    if writer is not None:
+        writer.release()
+    return video_path, count
+
+
+def convert_raw_recording(recording_dir, output_dir=None, workers=None, fps=None, backend="opencv", **options):
+    """
+    Demosaic and encode a raw recording across a process pool, one video segment (and its
+    timestamps sidecar) per chunk file
+    """
+    output_dir = output_dir or recording_dir
+    os.makedirs(output_dir, exist_ok=True)
+    fps = fps or estimate_fps(recording_dir)
+    jobs = [(path, output_dir, fps, backend, options) for path in chunk_paths(recording_dir)]
+    start_time = time.perf_counter()
+    total = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for video_path, count in pool.map(_convert_chunk, jobs):
+            total += count
+            print(f"{video_path}: {count} frames")
+    elapsed = time.perf_counter() - start_time
+    print(f"Converted {total} frames in {elapsed:.1f} s ({total / max(elapsed, 1e-9):.1f} fps) at {fps:.2f} fps")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('recording_dir', type=str, help='Directory of the raw chunk files')
+    parser.add_argument('--output_dir', type=str, help='Directory of the video segments', default=None)
+    parser.add_argument('--workers', type=int, help='Number of worker processes', default=None)
+    parser.add_argument('--fps', type=float, help='Frame rate of the videos, estimated when omitted', default=None)
+    add_writer_arguments(parser)
+    opt = parser.parse_args()
+    convert_raw_recording(opt.recording_dir, opt.output_dir, opt.workers, opt.fps, opt.writer_backend,
+                          **writer_options(opt))
@@ -0,0 +1,64 @@
+"""Numbered chunk files, preallocated and memory-mapped for writing, shared by the chunked recorders."""
+
+import os
+import glob
+import numpy as np
+
+
+def find_chunks(directory, pattern):
+    """Existing chunk files of a pattern with one integer field, e.g. "chunk_{:05d}.frames", in order"""
+    return sorted(glob.glob(os.path.join(directory, pattern.replace("{:05d}", "*"))))
+
+
+class ChunkFiles:
+    """
+    Chunk files of chunk_bytes, numbered by pattern in a directory. open() maps a chunk for writing and
+    close() truncates it to the bytes used, so each finished chunk holds exactly its records.
+    """
+
+    def __init__(self, directory, pattern, chunk_bytes):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.pattern = pattern
+        self.chunk_bytes = chunk_bytes
+        self.index = -1
+        self.chunk = None
+        self.untruncated = []       # (path, size) of chunks still mapped by views in use
+
+    def path(self, index):
+        return os.path.join(self.directory, self.pattern.format(index))
+
+    def open(self, index=None):
+        """
+        Map chunk `index` (the next one by default) as a uint8 array of chunk_bytes. A new chunk is
+        created, an existing one is reopened with its content and grown back to chunk_bytes.
+        """
+        self.index = self.index + 1 if index is None else index
+        path = self.path(self.index)
+        if os.path.isfile(path):
+            if os.path.getsize(path) < self.chunk_bytes:
+                os.truncate(path, self.chunk_bytes)
+            self.chunk = np.memmap(path, dtype=np.uint8, mode="r+", shape=(self.chunk_bytes,))
+        else:
+            self.chunk = np.memmap(path, dtype=np.uint8, mode="w+", shape=(self.chunk_bytes,))
+        return self.chunk
+
+    def close(self, used):
+        """Flush the open chunk and truncate it to its first `used` bytes"""
+        if self.chunk is None:
+            return
+        self.chunk.flush()
+        mapping, self.chunk = self.chunk._mmap, None
+        self.untruncated.append((self.path(self.index), used))
+        # Unmap before truncating, Windows cannot resize a mapped file. Views still held by the caller
+        # keep the mapping open, and their chunk is then truncated on a later call.
+        try:
+            mapping.close()
+        except BufferError:
+            pass
+        for path, size in list(self.untruncated):
+            try:
+                os.truncate(path, size)
+                self.untruncated.remove((path, size))
+            except OSError:
+                pass
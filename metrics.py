@@ -0,0 +1,170 @@
+"""Lightweight per-stage timing, counters and metrics export for the capture loops."""
+
+import os
+import json
+import time
+from bisect import bisect_left
+
+
+# Upper bounds (milliseconds) of the latency histogram buckets, the last bucket is unbounded
+BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 1000)
+SUMMARY_INTERVAL = 5        # seconds between summary lines
+
+
+class _NullTimer:
+    """Timer used when metrics are disabled: entering and exiting do nothing"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_TIMER = _NullTimer()
+
+
+class Histogram:
+    """Fixed-bucket latency histogram"""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, ms):
+        self.counts[bisect_left(BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total += ms
+        if ms > self.max:
+            self.max = ms
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile"""
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS_MS + (self.max,), self.counts):
+            seen += count
+            if seen >= rank and count:
+                return min(bound, self.max)
+        return 0.0
+
+
+class _Timer:
+    """Reusable context manager that records its duration into a histogram"""
+
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe((time.perf_counter_ns() - self.start) / 1e6)
+        return False
+
+
+class Metrics:
+    """
+    Stage timers, counters, a periodic summary line and an optional JSON or Prometheus-text export
+    (chosen by the export file extension: .json, otherwise Prometheus text).
+
+        metrics = Metrics("record_video")
+        with metrics.timer("grab"):
+            ret, frame = capture.read()
+        metrics.count("frames")
+        metrics.tick()
+    """
+
+    def __init__(self, name, enabled=True, summary_interval=SUMMARY_INTERVAL, export_file=None):
+        self.name = name
+        self.enabled = enabled
+        self.summary_interval = summary_interval
+        self.export_file = export_file
+        self.histograms = {}
+        self.timers = {}
+        self.counters = {}
+        self.start_time = time.perf_counter()
+        self.last_summary = self.start_time
+        self.last_frames = 0
+
+    def timer(self, stage):
+        """Context manager timing one stage"""
+        if not self.enabled:
+            return NULL_TIMER
+        timer = self.timers.get(stage)
+        if timer is None:
+            histogram = self.histograms[stage] = Histogram()
+            timer = self.timers[stage] = _Timer(histogram)
+        return timer
+
+    def count(self, counter, n=1):
+        if self.enabled:
+            self.counters[counter] = self.counters.get(counter, 0) + n
+
+    def tick(self):
+        """Print a summary line and export the metrics once every summary interval"""
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        if now - self.last_summary >= self.summary_interval:
+            self.summary(now)
+
+    def summary(self, now=None):
+        """Print one summary line: frame rate since the last summary, counters and stage latencies"""
+        if not self.enabled:
+            return
+        now = now or time.perf_counter()
+        frames = self.counters.get("frames", 0)
+        fps = (frames - self.last_frames) / max(now - self.last_summary, 1e-9)
+        stages = " | ".join(f"{stage} {h.total / max(h.count, 1):.2f}/{h.quantile(0.99):.2f} ms"
+                            for stage, h in self.histograms.items())
+        counters = " ".join(f"{counter}={value}" for counter, value in self.counters.items())
+        print(f"[{self.name}] {fps:.1f} fps | {counters} | mean/p99 {stages}")
+        self.last_summary, self.last_frames = now, frames
+        if self.export_file is not None:
+            self.export()
+
+    def to_dict(self):
+        return {"name": self.name,
+                "uptime_seconds": time.perf_counter() - self.start_time,
+                "counters": dict(self.counters),
+                "stages": {stage: {"buckets_ms": list(BUCKETS_MS), "counts": list(h.counts), "count": h.count,
+                                   "sum_ms": h.total, "max_ms": h.max}
+                           for stage, h in self.histograms.items()}}
+
+    def to_prometheus(self):
+        """Prometheus text exposition format"""
+        lines = []
+        label = f'job="{self.name}"'
+        for counter, value in self.counters.items():
+            lines.append(f"# TYPE camera_{counter}_total counter")
+            lines.append(f"camera_{counter}_total{{{label}}} {value}")
+        if self.histograms:
+            lines.append("# TYPE camera_stage_seconds histogram")
+        for stage, h in self.histograms.items():
+            cumulative = 0
+            for bound, count in zip(BUCKETS_MS, h.counts):
+                cumulative += count
+                lines.append(f'camera_stage_seconds_bucket{{{label},stage="{stage}",le="{bound / 1000:g}"}} '
+                             f'{cumulative}')
+            lines.append(f'camera_stage_seconds_bucket{{{label},stage="{stage}",le="+Inf"}} {h.count}')
+            lines.append(f'camera_stage_seconds_sum{{{label},stage="{stage}"}} {h.total / 1000:.6f}')
+            lines.append(f'camera_stage_seconds_count{{{label},stage="{stage}"}} {h.count}')
+        return "\n".join(lines) + "\n"
+
+    def export(self):
+        """Atomically replace the export file, so a scraper never reads a partial file"""
+        if self.export_file.endswith(".json"):
+            content = json.dumps(self.to_dict(), indent=1)
+        else:
+            content = self.to_prometheus()
+        tmp_file = f"{self.export_file}.{os.getpid()}.tmp"
+        with open(tmp_file, "w") as f:
+            f.write(content)
+        os.replace(tmp_file, self.export_file)
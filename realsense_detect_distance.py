@@ -1,76 +1,403 @@
-"""Detect distance at a specific point in the Intel Realsense camera view."""
-
-import numpy as np
-import cv2
-import pyrealsense2 as rs
-
-
-class DepthCamera:
-    def __init__(self):
-        # Configure depth and color streams
-        self.pipeline = rs.pipeline()
-        config = rs.config()
-
-        # Get device product line for setting a supporting resolution
-        pipeline_wrapper = rs.pipeline_wrapper(self.pipeline)
-        pipeline_profile = config.resolve(pipeline_wrapper)
-        device = pipeline_profile.get_device()
-        device_product_line = str(device.get_info(rs.camera_info.product_line))
-
-        config.enable_stream(rs.stream.depth, 1280, 720, rs.format.z16, 30)
-        config.enable_stream(rs.stream.color, 1280, 720, rs.format.bgr8, 30)
-
-        # Start streaming
-        self.pipeline.start(config)
-
-    def get_frame(self):
-        frames = self.pipeline.wait_for_frames()
-        depth_frame = frames.get_depth_frame()
-        color_frame = frames.get_color_frame()
-
-        depth_image = np.asanyarray(depth_frame.get_data())
-        color_image = np.asanyarray(color_frame.get_data())
-        if not depth_frame or not color_frame:
-            return False, None, None
-        return True, depth_image, color_image
-
-    def release(self):
-        self.pipeline.stop()
-
-
-point = (400, 300)
-
-
-def show_distance(event, x, y, args, params):
-    global point
-    point = (x, y)
-
-
-# Initialize Camera Intel Realsense
-dc = DepthCamera()
-
-# Create mouse event
-cv2.namedWindow("Color frame")
-cv2.setMouseCallback("Color frame", show_distance)
-
-while True:
-    ret, depth_frame, color_frame = dc.get_frame()
-
-    # Show distance for a specific point
-    cv2.circle(color_frame, point, 4, (180, 0, 150))
-    distance = depth_frame[point[1], point[0]]
-
-    cv2.putText(color_frame,
-                "{}mm".format(distance),
-                (point[0], point[1] - 20),
-                0,
-                1,
-                color=(180, 0, 150),
-                thickness=2,
-                lineType=cv2.LINE_AA)
-
-    cv2.imshow("Color frame", color_frame)
-
-    # Break the loop if 'q' is pressed
-    if cv2.waitKey(1) & 0xFF == ord("q"):
-        break
+"""Detect distance at a specific point in the Intel Realsense camera view."""
+
+import os
+import json
+import time
+import queue
+import argparse
+import threading
+import numpy as np
+import cv2
+
+
+# Set stream resolution, frame rate and acquisition parameters
+WIDTH, HEIGHT = 1280, 720
+FPS = 30
+QUEUE_SIZE = 2              # frames buffered between the acquisition thread and the UI
+FRAME_TIMEOUT = 5           # seconds to wait for a frame before giving up
+
+
+class DepthCamera:
+    def __init__(self):
+        # The SDK is only needed with a camera, not for replays or the depth queries
+        import pyrealsense2 as rs
+
+        # Configure depth and color streams
+        self.pipeline = rs.pipeline()
+        config = rs.config()
+
+        # Get device product line for setting a supporting resolution
+        pipeline_wrapper = rs.pipeline_wrapper(self.pipeline)
+        pipeline_profile = config.resolve(pipeline_wrapper)
+        device = pipeline_profile.get_device()
+        device_product_line = str(device.get_info(rs.camera_info.product_line))
+
+        config.enable_stream(rs.stream.depth, WIDTH, HEIGHT, rs.format.z16, FPS)
+        config.enable_stream(rs.stream.color, WIDTH, HEIGHT, rs.format.bgr8, FPS)
+
+        # Start streaming
+        self.pipeline.start(config)
+        self.timestamp = None   # capture timestamp (ms) of the last returned frame
+
+    def _wait_for_frames(self):
+        """Wait for the next frameset and copy its images out of the SDK frame pool"""
+        frames = self.pipeline.wait_for_frames(int(FRAME_TIMEOUT * 1000))
+        depth_frame = frames.get_depth_frame()
+        color_frame = frames.get_color_frame()
+        if not depth_frame or not color_frame:
+            return False, None, None, None
+
+        depth_image = np.array(depth_frame.get_data())
+        color_image = np.array(color_frame.get_data())
+        return True, depth_image, color_image, frames.get_timestamp()
+
+    def get_frame(self):
+        ret, depth_image, color_image, self.timestamp = self._wait_for_frames()
+        return ret, depth_image, color_image
+
+    def release(self):
+        self.pipeline.stop()
+
+
+class ThreadedDepthCamera(DepthCamera):
+    """
+    DepthCamera that acquires frames on a background thread into a small bounded queue. A recorder
+    given to it records every acquired frame on that thread, including those the UI never shows.
+    """
+
+    def __init__(self, queue_size=QUEUE_SIZE, recorder=None):
+        super().__init__()
+        self.recorder = recorder
+        self.frames = queue.Queue(maxsize=queue_size)
+        self.dropped_frames = 0
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._acquire, daemon=True)
+        self.thread.start()
+
+    def _acquire(self):
+        """Receive frames until released, dropping the oldest one when the queue is full"""
+        while not self.stop_event.is_set():
+            try:
+                frame = self._wait_for_frames()
+            except RuntimeError:
+                # wait_for_frames timed out or the pipeline was stopped
+                continue
+            if not frame[0]:
+                continue
+            if self.recorder is not None:
+                # Before the frame is queued, so the UI never draws on it while it is written
+                self.recorder.write(*frame[1:])
+            while True:
+                try:
+                    self.frames.put_nowait(frame)
+                    break
+                except queue.Full:
+                    try:
+                        self.frames.get_nowait()
+                        self.dropped_frames += 1
+                    except queue.Empty:
+                        pass
+
+    def get_frame(self):
+        """Return the latest acquired frame, counting older queued ones as dropped"""
+        try:
+            frame = self.frames.get(timeout=FRAME_TIMEOUT)
+        except queue.Empty:
+            return False, None, None
+        while True:
+            try:
+                frame = self.frames.get_nowait()
+                self.dropped_frames += 1
+            except queue.Empty:
+                break
+        ret, depth_image, color_image, self.timestamp = frame
+        return ret, depth_image, color_image
+
+    def release(self):
+        self.stop_event.set()
+        self.thread.join(timeout=FRAME_TIMEOUT + 1)
+        super().release()
+
+
+class DepthRecorder:
+    """
+    Record depth and color frames to an on-disk stream that can be memory-mapped for replay:
+    raw frames appended to depth.raw/color.raw, capture timestamps to timestamps.raw and the
+    frame shapes to meta.json.
+    """
+
+    def __init__(self, output_dir):
+        os.makedirs(output_dir, exist_ok=True)
+        self.output_dir = output_dir
+        self.files = None
+        self.frame_count = 0
+
+    def write(self, depth_image, color_image, timestamp):
+        if self.files is None:
+            with open(os.path.join(self.output_dir, "meta.json"), "w") as meta_file:
+                json.dump({"depth_shape": depth_image.shape, "depth_dtype": str(depth_image.dtype),
+                           "color_shape": color_image.shape, "color_dtype": str(color_image.dtype)},
+                          meta_file)
+            self.files = [open(os.path.join(self.output_dir, name), "wb")
+                          for name in ("depth.raw", "color.raw", "timestamps.raw")]
+        depth_file, color_file, timestamps_file = self.files
+        depth_file.write(np.ascontiguousarray(depth_image).data)
+        color_file.write(np.ascontiguousarray(color_image).data)
+        timestamps_file.write(np.float64(timestamp or 0).tobytes())
+        self.frame_count += 1
+
+    def release(self):
+        if self.files is not None:
+            for file in self.files:
+                file.close()
+
+
+class ReplayDepthCamera:
+    """Serve a DepthRecorder recording through the DepthCamera interface, without a camera"""
+
+    def __init__(self, recording_dir, real_time=True, loop=True):
+        with open(os.path.join(recording_dir, "meta.json")) as meta_file:
+            meta = json.load(meta_file)
+        self.depth_images = self._map(os.path.join(recording_dir, "depth.raw"),
+                                      meta["depth_dtype"], meta["depth_shape"])
+        self.color_images = self._map(os.path.join(recording_dir, "color.raw"),
+                                      meta["color_dtype"], meta["color_shape"])
+        self.timestamps = self._map(os.path.join(recording_dir, "timestamps.raw"), "float64", [])
+        # A recording interrupted mid-frame keeps only its complete frames
+        self.frame_count = min(len(self.depth_images), len(self.color_images), len(self.timestamps))
+        self.real_time = real_time
+        self.loop = loop
+        self.position = 0
+        self.timestamp = None
+        self.clock_start = None
+
+    @staticmethod
+    def _map(path, dtype, shape):
+        frame_bytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        count = os.path.getsize(path) // frame_bytes
+        if count == 0:
+            return np.zeros((0, *shape), dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode="r", shape=(count, *shape))
+
+    def get_frame(self):
+        if self.position >= self.frame_count:
+            if not self.loop or self.frame_count == 0:
+                return False, None, None
+            self.position = 0
+            self.clock_start = None
+        index = self.position
+        self.position += 1
+        self.timestamp = float(self.timestamps[index])
+
+        if self.real_time:
+            # Pace the frames by their recorded timestamps (ms)
+            now = time.perf_counter()
+            if self.clock_start is None:
+                self.clock_start = now - self.timestamp / 1000
+            delay = self.clock_start + self.timestamp / 1000 - now
+            if delay > 0:
+                time.sleep(delay)
+
+        # Copy the color frame so drawing on it never touches the read-only recording
+        return True, self.depth_images[index], np.array(self.color_images[index])
+
+    def release(self):
+        pass
+
+
+# Half-size of the window (in pixels) around each point used for the depth statistics
+POINT_RADIUS = 3
+# Depth values above any valid z16 reading, used to push invalid/padding pixels to the end of a sort
+INVALID_DEPTH = np.iinfo(np.uint16).max
+# Regions of up to BATCH_PIXELS pixels are sorted in batches of one size, larger ones are handled one by one
+BATCH_PIXELS = 4096
+
+
+def _next_power_of_two(sizes):
+    return np.left_shift(1, np.ceil(np.log2(np.maximum(sizes, 1))).astype(np.int64))
+
+
+def points_to_rects(points, radius=POINT_RADIUS):
+    """Convert (x, y) points to (x, y, w, h) windows of side 2*radius+1 centered on them"""
+    points = np.asarray(points, dtype=np.int64).reshape(-1, 2)
+    side = 2*radius + 1
+    return np.column_stack((points - radius, np.full((len(points), 2), side, dtype=np.int64)))
+
+
+def query_depth(depth_image, points=None, rects=None, radius=POINT_RADIUS):
+    """
+    Robust depth statistics for many points and/or rectangles of a depth image at once.
+
+    Points (x, y) are measured over a (2*radius+1)^2 window, rectangles are (x, y, w, h).
+    Zero depth readings are invalid and ignored. Returns a dict of arrays, one entry per
+    region (points first, then rectangles): "median" and "min" depth (0 where the region
+    has no valid pixel) and "valid_ratio", the fraction of valid pixels in the region.
+    """
+    regions = []
+    if points is not None and len(points):
+        regions.append(points_to_rects(points, radius))
+    if rects is not None and len(rects):
+        regions.append(np.asarray(rects, dtype=np.int64).reshape(-1, 4))
+    if not regions:
+        empty = np.zeros(0)
+        return {"median": empty, "min": empty, "valid_ratio": empty}
+    regions = np.concatenate(regions)
+
+    # Clip the regions to the image
+    height, width = depth_image.shape[:2]
+    x0 = np.clip(regions[:, 0], 0, width)
+    y0 = np.clip(regions[:, 1], 0, height)
+    x1 = np.clip(regions[:, 0] + regions[:, 2], 0, width)
+    y1 = np.clip(regions[:, 1] + regions[:, 3], 0, height)
+    areas = (x1 - x0) * (y1 - y0)
+
+    heights, widths = y1 - y0, x1 - x0
+    median = np.zeros(len(regions))
+    minimum = np.zeros(len(regions), dtype=depth_image.dtype)
+    valid = np.zeros(len(regions), dtype=np.int64)
+
+    # Regions are gathered by size class, the next power of two of their longer clipped side, so that
+    # points never pad up to a large rectangle while regions of similar sizes still share one sort
+    classes, class_index = np.unique(_next_power_of_two(np.maximum(heights, widths)), return_inverse=True)
+    for group in range(len(classes)):
+        members = np.flatnonzero(class_index == group)
+        max_h, max_w = int(heights[members].max()), int(widths[members].max())
+        if max_h * max_w == 0:
+            continue
+        if max_h * max_w > BATCH_PIXELS:
+            # Large regions one at a time, partitioned around the median instead of sorted
+            for i in members:
+                window = depth_image[y0[i]:y1[i], x0[i]:x1[i]]
+                values = window[window != 0]
+                valid[i] = len(values)
+                if len(values):
+                    values = np.partition(values, [(len(values) - 1) // 2, len(values) // 2])
+                    median[i] = (float(values[(len(values) - 1) // 2]) + values[len(values) // 2]) / 2
+                    minimum[i] = values.min()
+            continue
+
+        # Common (n, max_h, max_w) window for the class, padding outside each region
+        ys = y0[members, None] + np.arange(max_h)[None, :]
+        xs = x0[members, None] + np.arange(max_w)[None, :]
+        inside = (ys < y1[members, None])[:, :, None] & (xs < x1[members, None])[:, None, :]
+        values = depth_image[np.minimum(ys, height - 1)[:, :, None], np.minimum(xs, width - 1)[:, None, :]]
+        values = np.where(inside & (values != 0), values, INVALID_DEPTH).reshape(len(members), -1)
+
+        # One sort per region gives min and median of the valid pixels, invalid ones sort last
+        values.sort(axis=1)
+        count = np.count_nonzero(values != INVALID_DEPTH, axis=1)
+        low = np.take_along_axis(values, np.maximum((count - 1) // 2, 0)[:, None], axis=1)[:, 0]
+        high = np.take_along_axis(values, np.maximum(count // 2, 0)[:, None], axis=1)[:, 0]
+        median[members] = np.where(count > 0, (low.astype(np.float64) + high) / 2, 0)
+        minimum[members] = np.where(count > 0, values[:, 0], 0)
+        valid[members] = count
+
+    valid_ratio = np.divide(valid, areas, out=np.zeros(len(regions)), where=areas > 0)
+    return {"median": median, "min": minimum, "valid_ratio": valid_ratio}
+
+
+def benchmark_query_depth(num_regions=48, repeats=200):
+    """Time query_depth on a synthetic 1280x720 depth image"""
+    rng = np.random.default_rng(0)
+    depth_image = rng.integers(0, 4000, (720, 1280), dtype=np.uint16)
+    depth_image[rng.random((720, 1280)) < 0.1] = 0
+    points = np.column_stack((rng.integers(0, 1280, num_regions // 2), rng.integers(0, 720, num_regions // 2)))
+    rects = np.column_stack((rng.integers(0, 1200, num_regions // 2), rng.integers(0, 650, num_regions // 2),
+                             rng.integers(5, 40, num_regions // 2), rng.integers(5, 40, num_regions // 2)))
+    start = time.perf_counter()
+    for _ in range(repeats):
+        query_depth(depth_image, points, rects)
+    elapsed = (time.perf_counter() - start) / repeats
+    print(f"query_depth: {num_regions} regions on 1280x720 in {elapsed*1000:.3f} ms")
+
+    # Points together with one large rectangle
+    large_rect = [(320, 180, 640, 360)]
+    start = time.perf_counter()
+    for _ in range(repeats // 10):
+        query_depth(depth_image, points, large_rect)
+    elapsed = (time.perf_counter() - start) / (repeats // 10)
+    print(f"query_depth: {len(points)} points and a 640x360 rectangle on 1280x720 in {elapsed*1000:.3f} ms")
+
+
+cursor = (400, 300)
+points = []
+
+
+def show_distance(event, x, y, args, params):
+    """Follow the cursor, add a fixed point on left click and clear them on right click"""
+    global cursor
+    cursor = (x, y)
+    if event == cv2.EVENT_LBUTTONDOWN:
+        points.append((x, y))
+    elif event == cv2.EVENT_RBUTTONDOWN:
+        points.clear()
+
+
+def main(replay_dir=None, record_dir=None, threaded=True):
+    """Main"""
+    # Initialize Camera Intel Realsense, or replay a recording
+    recorder = DepthRecorder(record_dir) if record_dir is not None else None
+    if replay_dir is not None:
+        dc = ReplayDepthCamera(replay_dir)
+    elif threaded:
+        # Frames are recorded as they are acquired, independently of the UI rate
+        dc = ThreadedDepthCamera(recorder=recorder)
+    else:
+        dc = DepthCamera()
+
+    # Create mouse event
+    cv2.namedWindow("Color frame")
+    cv2.setMouseCallback("Color frame", show_distance)
+
+    while True:
+        ret, depth_frame, color_frame = dc.get_frame()
+        if not ret:
+            if replay_dir is not None:
+                break
+            continue
+        if recorder is not None and not isinstance(dc, ThreadedDepthCamera):
+            recorder.write(depth_frame, color_frame, dc.timestamp)
+
+        # Show distance for the cursor and every fixed point, in one query
+        query_points = [cursor] + points
+        stats = query_depth(depth_frame, query_points)
+        for point, median, valid_ratio in zip(query_points, stats["median"], stats["valid_ratio"]):
+            cv2.circle(color_frame, point, 4, (180, 0, 150))
+            cv2.putText(color_frame,
+                        "{:.0f}mm ({:.0%})".format(median, valid_ratio),
+                        (point[0], point[1] - 20),
+                        0,
+                        1,
+                        color=(180, 0, 150),
+                        thickness=2,
+                        lineType=cv2.LINE_AA)
+
+        if isinstance(dc, ThreadedDepthCamera):
+            cv2.putText(color_frame, "Dropped frames: {}".format(dc.dropped_frames), (20, 40),
+                        0, 1, color=(180, 0, 150), thickness=2, lineType=cv2.LINE_AA)
+
+        cv2.imshow("Color frame", color_frame)
+
+        # Break the loop if 'q' is pressed
+        if cv2.waitKey(1) & 0xFF == ord("q"):
+            break
+
+    dc.release()
+    if recorder is not None:
+        recorder.release()
+        print(f"Recorded {recorder.frame_count} frames to {record_dir}")
+    cv2.destroyAllWindows()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--benchmark', action='store_true', help='Time the depth queries on synthetic data')
+    parser.add_argument('--record_dir', type=str, help='Directory to record depth and color frames to', default=None)
+    parser.add_argument('--replay_dir', type=str, help='Directory of a recording to replay instead of the camera',
+                        default=None)
+    parser.add_argument('--blocking', action='store_true', help='Wait for frames on the UI thread')
+    opt = parser.parse_args()
+    if opt.benchmark:
+        benchmark_query_depth()
+    else:
+        main(opt.replay_dir, opt.record_dir, threaded=not opt.blocking)
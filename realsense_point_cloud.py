@@ -0,0 +1,264 @@
+"""Convert Intel Realsense depth frames to point clouds using cached deprojection tables."""
+
+import time
+import argparse
+from collections import namedtuple
+from functools import lru_cache
+import numpy as np
+import cv2
+
+from realsense_detect_distance import ThreadedDepthCamera
+
+
+# Same fields as pyrealsense2.intrinsics / pyrealsense2.extrinsics, but hashable so they can key the cache
+Intrinsics = namedtuple("Intrinsics", ["width", "height", "ppx", "ppy", "fx", "fy", "model", "coeffs"],
+                        defaults=["none", (0.0, 0.0, 0.0, 0.0, 0.0)])
+Extrinsics = namedtuple("Extrinsics", ["rotation", "translation"])
+
+
+def to_intrinsics(intrinsics):
+    """Convert a pyrealsense2.intrinsics (or any object with the same fields) to Intrinsics"""
+    if isinstance(intrinsics, Intrinsics):
+        return intrinsics
+    model = str(getattr(intrinsics, "model", "none")).split(".")[-1]
+    coeffs = tuple(float(c) for c in getattr(intrinsics, "coeffs", (0.0,) * 5))
+    return Intrinsics(int(intrinsics.width), int(intrinsics.height), float(intrinsics.ppx),
+                      float(intrinsics.ppy), float(intrinsics.fx), float(intrinsics.fy), model, coeffs)
+
+
+@lru_cache(maxsize=16)
+def _ray_table(intrinsics, decimation, offset=0.0):
+    """(H, W, 3) float32 rays such that point = ray * depth, for every (decimated) pixel shifted by offset"""
+    ys = np.arange(0, intrinsics.height, decimation, dtype=np.float64) + offset
+    xs = np.arange(0, intrinsics.width, decimation, dtype=np.float64) + offset
+    x = (xs[None, :] - intrinsics.ppx) / intrinsics.fx
+    y = (ys[:, None] - intrinsics.ppy) / intrinsics.fy
+    x, y = np.broadcast_to(x, (len(ys), len(xs))), np.broadcast_to(y, (len(ys), len(xs)))
+
+    if intrinsics.model == "inverse_brown_conrady" and any(intrinsics.coeffs):
+        # Undistort once here, as rs2_deproject_pixel_to_point does for every pixel
+        c = intrinsics.coeffs
+        r2 = x*x + y*y
+        f = 1 + c[0]*r2 + c[1]*r2*r2 + c[4]*r2*r2*r2
+        x, y = (x*f + 2*c[2]*x*y + c[3]*(r2 + 2*x*x),
+                y*f + 2*c[3]*x*y + c[2]*(r2 + 2*y*y))
+
+    table = np.empty((len(ys), len(xs), 3), dtype=np.float32)
+    table[..., 0] = x
+    table[..., 1] = y
+    table[..., 2] = 1
+    table.setflags(write=False)
+    return table
+
+
+def ray_table(intrinsics, decimation=1, offset=0.0):
+    """
+    Cached deprojection table for an intrinsics/resolution/decimation combination, through the pixel
+    centers or, with an offset, through points shifted by offset pixels in x and y
+    """
+    return _ray_table(to_intrinsics(intrinsics), int(decimation), float(offset))
+
+
+def depth_to_points(depth_image, intrinsics, depth_scale=0.001, decimation=1, out=None):
+    """
+    Deproject a depth image to an (H, W, 3) float32 point cloud in meters.
+
+    Every `decimation`-th pixel is kept in both directions. Invalid (zero) depth gives (0, 0, 0).
+    Pass `out` to reuse the output array across frames.
+    """
+    table = ray_table(intrinsics, decimation)
+    depth = depth_image[::decimation, ::decimation]
+    if out is None:
+        out = np.empty(table.shape, dtype=np.float32)
+    np.multiply(table, depth[..., None], out=out, dtype=np.float32)
+    out *= depth_scale
+    return out
+
+
+def _project(points, extrinsics, intrinsics):
+    """
+    Pixel coordinates and depths of (N, 3) depth camera points in another camera, distorted as
+    rs2_project_point_to_pixel does for the (modified) Brown-Conrady models
+    """
+    rotation = np.asarray(extrinsics.rotation, dtype=np.float32).reshape(3, 3)
+    points = points @ rotation + np.asarray(extrinsics.translation, dtype=np.float32)
+    z = points[:, 2]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x, y = points[:, 0] / z, points[:, 1] / z
+    if intrinsics.model in ("brown_conrady", "modified_brown_conrady") and any(intrinsics.coeffs):
+        c = intrinsics.coeffs
+        r2 = x*x + y*y
+        f = 1 + c[0]*r2 + c[1]*r2*r2 + c[4]*r2*r2*r2
+        if intrinsics.model == "modified_brown_conrady":
+            x, y = x*f, y*f
+            x, y = x + 2*c[2]*x*y + c[3]*(r2 + 2*x*x), y + 2*c[3]*x*y + c[2]*(r2 + 2*y*y)
+        else:
+            x, y = x*f + 2*c[2]*x*y + c[3]*(r2 + 2*x*x), y*f + 2*c[3]*x*y + c[2]*(r2 + 2*y*y)
+    return x * intrinsics.fx + intrinsics.ppx, y * intrinsics.fy + intrinsics.ppy, z
+
+
+def align_depth_to_color(depth_image, depth_intrinsics, color_intrinsics, extrinsics, depth_scale=0.001,
+                         decimation=1):
+    """
+    Reproject a depth image into the color camera, as rs.align(rs.stream.color) does: the two opposite
+    corners of each depth pixel (of each decimation x decimation block) are projected into the color
+    image and the rectangle between them is filled, so upsampling to the color resolution leaves no holes.
+
+    `extrinsics` is the depth-to-color transform (rotation stored column-major, as in pyrealsense2).
+    Returns a depth image with the color stream's resolution and the depth image's units,
+    keeping the nearest depth where several pixels cover the same color pixel.
+    """
+    color_intrinsics = to_intrinsics(color_intrinsics)
+    if any(color_intrinsics.coeffs) and color_intrinsics.model not in ("brown_conrady", "modified_brown_conrady"):
+        raise ValueError(f"Cannot project to a color stream with {color_intrinsics.model} distortion")
+    width, height = color_intrinsics.width, color_intrinsics.height
+    depth = depth_image[::decimation, ::decimation].reshape(-1)
+    valid = depth > 0
+    depth = depth[valid]
+    meters = depth.astype(np.float32)[:, None] * np.float32(depth_scale)
+
+    # Corners of the area each kept pixel stands for, from -0.5 to decimation - 0.5 pixels
+    rays0 = ray_table(depth_intrinsics, decimation, -0.5).reshape(-1, 3)[valid]
+    rays1 = ray_table(depth_intrinsics, decimation, decimation - 0.5).reshape(-1, 3)[valid]
+    u0, v0, z0 = _project(rays0 * meters, extrinsics, color_intrinsics)
+    u1, v1, z1 = _project(rays1 * meters, extrinsics, color_intrinsics)
+    # A footprint covers the color pixels whose centers lie in [u0, u1) x [v0, v1), so adjacent footprints
+    # share no pixel and identical cameras give back the depth image
+    with np.errstate(invalid="ignore"):
+        u0, v0, u1, v1 = np.ceil(u0), np.ceil(v0), np.ceil(u1) - 1, np.ceil(v1) - 1
+    # Footprints reaching outside the color image are dropped, as librealsense does
+    inside = (z0 > 0) & (z1 > 0) & (u0 >= 0) & (v0 >= 0) & (u1 < width) & (v1 < height) & (u1 >= u0) & (v1 >= v0)
+    x0, y0 = u0[inside].astype(np.int64), v0[inside].astype(np.int64)
+    footprint_w = u1[inside].astype(np.int64) - x0 + 1
+    footprint_h = v1[inside].astype(np.int64) - y0 + 1
+    depth = depth[inside]
+
+    # Nearest depth per color pixel, the empty ones keep the dtype's maximum until the end
+    empty = np.iinfo(depth_image.dtype).max
+    aligned = np.full((height, width), empty, dtype=depth_image.dtype)
+    flat = aligned.reshape(-1)
+    start = y0 * width + x0
+    for dy in range(int(footprint_h.max(initial=0))):
+        for dx in range(int(footprint_w.max(initial=0))):
+            covers = (dx < footprint_w) & (dy < footprint_h)
+            np.minimum.at(flat, start[covers] + (dy * width + dx), depth[covers])
+    aligned[aligned == empty] = 0
+    return aligned
+
+
+class PointCloudDepthCamera(ThreadedDepthCamera):
+    """ThreadedDepthCamera that also returns point clouds built from cached deprojection tables"""
+
+    def __init__(self, decimation=1):
+        import pyrealsense2 as rs
+
+        super().__init__()
+        profile = self.pipeline.get_active_profile()
+        depth_profile = profile.get_stream(rs.stream.depth).as_video_stream_profile()
+        color_profile = profile.get_stream(rs.stream.color).as_video_stream_profile()
+        self.depth_intrinsics = to_intrinsics(depth_profile.get_intrinsics())
+        self.color_intrinsics = to_intrinsics(color_profile.get_intrinsics())
+        extrinsics = depth_profile.get_extrinsics_to(color_profile)
+        self.extrinsics = Extrinsics(tuple(extrinsics.rotation), tuple(extrinsics.translation))
+        self.depth_scale = profile.get_device().first_depth_sensor().get_depth_scale()
+        self.decimation = decimation
+        self.points = None
+
+    def get_point_cloud(self):
+        """Return (ret, points, color_image), points being (H, W, 3) in meters in the depth camera frame"""
+        ret, depth_image, color_image = self.get_frame()
+        if not ret:
+            return False, None, None
+        self.points = depth_to_points(depth_image, self.depth_intrinsics, self.depth_scale, self.decimation,
+                                      out=self.points)
+        return True, self.points, color_image
+
+    def get_aligned_frame(self):
+        """Return (ret, depth_image, color_image) with the depth image aligned to the color stream"""
+        ret, depth_image, color_image = self.get_frame()
+        if not ret:
+            return False, None, None
+        aligned = align_depth_to_color(depth_image, self.depth_intrinsics, self.color_intrinsics,
+                                       self.extrinsics, self.depth_scale, self.decimation)
+        return True, aligned, color_image
+
+
+def benchmark_depth_to_points(repeats=50):
+    """Time point cloud generation on a synthetic 1280x720 depth image"""
+    intrinsics = Intrinsics(1280, 720, 640.0, 360.0, 900.0, 900.0)
+    depth_image = np.random.default_rng(0).integers(0, 4000, (720, 1280), dtype=np.uint16)
+    for decimation in (1, 2, 4):
+        out = None
+        start = time.perf_counter()
+        for _ in range(repeats):
+            out = depth_to_points(depth_image, intrinsics, decimation=decimation, out=out)
+        elapsed = (time.perf_counter() - start) / repeats
+        print(f"depth_to_points: 1280x720, decimation {decimation} in {elapsed*1000:.3f} ms")
+
+
+def check_align_identity():
+    """Aligning a depth image to an identical camera must give the depth image back"""
+    intrinsics = Intrinsics(640, 480, 319.5, 239.5, 600.0, 600.0)
+    extrinsics = Extrinsics((1.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 1.0), (0.0, 0.0, 0.0))
+    depth_image = np.random.default_rng(0).integers(0, 4000, (480, 640), dtype=np.uint16)
+    aligned = align_depth_to_color(depth_image, intrinsics, intrinsics, extrinsics)
+    differing = int(np.count_nonzero(aligned != depth_image))
+    print(f"align_depth_to_color: {differing} of {depth_image.size} pixels differ from the identity alignment")
+    return differing == 0
+
+
+cursor = (400, 300)
+
+
+def follow_cursor(event, x, y, args, params):
+    global cursor
+    cursor = (x, y)
+
+
+def main(decimation=1):
+    """Show the 3D point under the cursor"""
+    dc = PointCloudDepthCamera(decimation)
+
+    cv2.namedWindow("Color frame")
+    cv2.setMouseCallback("Color frame", follow_cursor)
+
+    while True:
+        ret, points, color_frame = dc.get_point_cloud()
+        if not ret:
+            continue
+
+        x, y, z = points[min(cursor[1] // decimation, points.shape[0] - 1),
+                         min(cursor[0] // decimation, points.shape[1] - 1)]
+        cv2.circle(color_frame, cursor, 4, (180, 0, 150))
+        cv2.putText(color_frame,
+                    "({:.3f}, {:.3f}, {:.3f})m".format(x, y, z),
+                    (cursor[0], cursor[1] - 20),
+                    0,
+                    1,
+                    color=(180, 0, 150),
+                    thickness=2,
+                    lineType=cv2.LINE_AA)
+
+        cv2.imshow("Color frame", color_frame)
+
+        # Break the loop if 'q' is pressed
+        if cv2.waitKey(1) & 0xFF == ord("q"):
+            break
+
+    dc.release()
+    cv2.destroyAllWindows()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--decimation', type=int, help='Keep every n-th depth pixel', default=1)
+    parser.add_argument('--benchmark', action='store_true', help='Time point cloud generation on synthetic data')
+    parser.add_argument('--check_align', action='store_true', help='Check that aligning to an identical camera '
+                        'returns the depth image')
+    opt = parser.parse_args()
+    if opt.benchmark:
+        benchmark_depth_to_points()
+    elif opt.check_align:
+        exit(0 if check_align_identity() else 1)
+    else:
+        main(opt.decimation)
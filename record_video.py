@@ -1,15 +1,27 @@
 """Record a video using OpenCV."""
 
-import os
 import time
+import numpy as np
 import cv2
 
+from metrics import Metrics
+from video_writers import open_writer
+
 # Set capture index, resolution, frame rate, duration and video type
 CAMERA_INDEX = 2            # {0, 2}
 RESOLUTION = 'FHD'          # {360p, 480p, 540p, HD/720p, FHD/1080p, 4K}
 FPS = 30                    # {30, 60}
 DURATION = 20               # seconds
 VIDEO_TYPE = 'avi'          # {avi, mp4}
+CAPTURE_CLOCK = False       # pace the video to the capture timestamps: repeat frames over gaps, drop early frames
+
+# Motion-gated recording: write only while there is motion, with the seconds before and after it
+MOTION_GATED = False        # DURATION then counts captured rather than written frames
+MOTION_SIZE = (160, 90)     # grayscale size the frames are downsampled to for motion scoring
+MOTION_PIXEL_DELTA = 20     # gray level change for a pixel to count as moving
+MOTION_THRESHOLD = 0.005    # fraction of moving pixels that starts or extends an event
+PRE_ROLL = 3                # seconds kept in memory and written before an event
+POST_ROLL = 5               # seconds written after the last motion
 
 # Define the video file and codec
 TIMESTAMP = time.strftime("%Y%m%d_%H%M%S_", time.localtime(time.time()))
@@ -17,6 +29,14 @@ OUTPUT_VIDEO_FILE = f"videos/{TIMESTAMP}_{RESOLUTION}@{FPS}.{VIDEO_TYPE}"
 CODEC = {'avi': 'MJPG', 'mp4': 'H264'}
 FOURCC = cv2.VideoWriter_fourcc(*CODEC[VIDEO_TYPE])         # type: ignore
 
+# Video writer backend: "opencv" (cv2.VideoWriter) or "ffmpeg" (raw frames piped to an ffmpeg process)
+WRITER_BACKEND = 'opencv'
+WRITER_OPTIONS = {}         # ffmpeg only, e.g. {"preset": "veryfast", "threads": 4, "crf": 23}
+
+# Per-stage timing, periodic summary line and optional export (.json or Prometheus text)
+METRICS_ENABLED = True
+METRICS_FILE = None         # e.g. "videos/record_video.prom"
+
 # Standard video resolutions, scaling
 STD_RESOLUTIONS =  {
     "360p": (640, 360),
@@ -28,6 +48,26 @@ STD_RESOLUTIONS =  {
     "4K": (3840, 2160)}
 WIDTH, HEIGHT = STD_RESOLUTIONS[RESOLUTION][0], STD_RESOLUTIONS[RESOLUTION][1]
 
+# Text overlay, scaled to the capture resolution by open_capture
+font = cv2.FONT_HERSHEY_SIMPLEX
+color = (0, 255, 0)
+scaling = font_scale = 1
+font_thickness = 2
+
+
+def open_capture():
+    """Open the camera and scale the text overlay to its resolution"""
+    global scaling, font_scale, font_thickness
+    capture = cv2.VideoCapture(CAMERA_INDEX)
+    capture.set(cv2.CAP_PROP_FOURCC, FOURCC)
+    capture.set(cv2.CAP_PROP_FRAME_WIDTH, WIDTH)
+    capture.set(cv2.CAP_PROP_FRAME_HEIGHT, HEIGHT)
+    capture.set(cv2.CAP_PROP_FPS, FPS)
+    scaling = int(max(capture.get(cv2.CAP_PROP_FRAME_WIDTH)/1920, 1))
+    font_scale = scaling
+    font_thickness = 2*scaling
+    return capture
+
 
 def put_text(frame, text, f_scale, thickness):
     """Put text on a frame"""
@@ -69,57 +109,215 @@ def put_text(frame, text, f_scale, thickness):
     return frame
 
 
+class FramePacer:
+    """
+    Map capture timestamps to the slots of a constant frame rate timeline, so the video plays back in
+    real time when the camera delivers frames late (the previous frame fills the gap) or early (dropped)
+    """
+
+    def __init__(self, fps):
+        self.period = 1 / fps
+        self.start = None
+        self.next_slot = 0
+        self.fills = 0
+        self.drops = 0
+
+    def pace(self, timestamp):
+        """Number of times to repeat the last written frame before this one, or None to drop this one"""
+        if self.start is None:
+            self.start = timestamp
+        slot = int(round((timestamp - self.start) / self.period))
+        if slot < self.next_slot:
+            self.drops += 1
+            return None
+        fills = slot - self.next_slot
+        self.fills += fills
+        self.next_slot = slot + 1
+        return fills
+
+
+class CaptureClock:
+    """
+    Capture timestamp of the frame just read, in seconds: the driver's timestamp (CAP_PROP_POS_MSEC, set by
+    the V4L2 and MSMF backends) when the backend provides one, otherwise the host time at which read()
+    returned. If the driver timestamps stop advancing, the host time takes over from the last of them.
+    """
+
+    def __init__(self, capture):
+        self.capture = capture
+        self.last = None
+        self.host_offset = None     # set once the host clock is used
+
+    def now(self):
+        if self.host_offset is None:
+            timestamp = self.capture.get(cv2.CAP_PROP_POS_MSEC) / 1000
+            if timestamp > 0 and (self.last is None or timestamp > self.last):
+                self.last = timestamp
+                return timestamp
+            self.host_offset = 0.0 if self.last is None else self.last - time.perf_counter()
+        return time.perf_counter() + self.host_offset
+
+
+class MotionDetector:
+    """
+    Motion score of a frame: the fraction of pixels of its downsampled, blurred grayscale copy that changed
+    by more than pixel_delta since the previous frame. All buffers are allocated once.
+    """
+
+    def __init__(self, size=MOTION_SIZE, pixel_delta=MOTION_PIXEL_DELTA):
+        self.size = size
+        self.pixel_delta = pixel_delta
+        self.small = np.empty((size[1], size[0], 3), np.uint8)
+        self.gray = np.empty((size[1], size[0]), np.uint8)
+        self.previous = None
+        self.diff = np.empty_like(self.gray)
+
+    def score(self, frame):
+        cv2.resize(frame, self.size, self.small, interpolation=cv2.INTER_LINEAR)
+        cv2.cvtColor(self.small, cv2.COLOR_BGR2GRAY, self.gray)
+        cv2.GaussianBlur(self.gray, (5, 5), 0, self.gray)
+        if self.previous is None:
+            self.previous = self.gray.copy()
+            return 0.0
+        cv2.absdiff(self.gray, self.previous, self.diff)
+        cv2.threshold(self.diff, self.pixel_delta, 255, cv2.THRESH_BINARY, self.diff)
+        self.gray, self.previous = self.previous, self.gray
+        return cv2.countNonZero(self.diff) / self.diff.size
+
+
+class MotionGate:
+    """
+    Choose the frames to write: those with motion, the post_roll seconds after the last motion and, when an
+    event starts, the pre_roll seconds before it. The pre-roll lives in a preallocated ring of frames that the
+    camera decodes straight into (capture.read into slot()), so idle frames are neither copied nor encoded.
+    """
+
+    def __init__(self, fps, pre_roll=PRE_ROLL, post_roll=POST_ROLL, threshold=MOTION_THRESHOLD):
+        self.detector = MotionDetector()
+        self.threshold = threshold
+        self.ring_length = int(pre_roll * fps) + 1       # pre-roll frames and the frame being captured
+        self.ring = None
+        self.head = 0
+        self.buffered = 0
+        self.post_roll_frames = int(post_roll * fps)
+        self.remaining = 0
+        self.events = 0
+
+    def slot(self):
+        """Ring slot the next frame should be captured into"""
+        return None if self.ring is None else self.ring[self.head]
+
+    def is_moving(self, frame):
+        """Score the frame before anything (e.g. the text overlay) is drawn on it"""
+        return self.detector.score(frame) >= self.threshold
+
+    def update(self, frame, moving):
+        """Frames to write now, oldest first: none while idle, the pre-roll and this frame when an event starts"""
+        if self.ring is None:
+            self.ring = np.empty((self.ring_length,) + frame.shape, frame.dtype)
+        slot = self.ring[self.head]
+        if frame.ctypes.data != slot.ctypes.data:
+            slot[...] = frame
+
+        frames = []
+        if moving:
+            if self.remaining == 0:
+                self.events += 1
+                frames = [self.ring[(self.head - i) % self.ring_length] for i in range(self.buffered, 0, -1)]
+            self.remaining = self.post_roll_frames + 1
+        if self.remaining:
+            self.remaining -= 1
+            frames.append(slot)
+            self.buffered = 0
+        else:
+            self.buffered = min(self.buffered + 1, self.ring_length - 1)
+        self.head = (self.head + 1) % self.ring_length
+        return frames
+
+
 def main():
     """Main"""
-    video_writer = cv2.VideoWriter(OUTPUT_VIDEO_FILE, FOURCC, FPS, (WIDTH, HEIGHT))
-    num_frames = 0
+    capture = open_capture()
+    video_writer = open_writer(OUTPUT_VIDEO_FILE, FPS, (WIDTH, HEIGHT), WRITER_BACKEND, CODEC[VIDEO_TYPE],
+                               **WRITER_OPTIONS)
+    metrics = Metrics("record_video", METRICS_ENABLED, export_file=METRICS_FILE)
+    pacer = FramePacer(FPS) if CAPTURE_CLOCK and not MOTION_GATED else None
+    clock = CaptureClock(capture)
+    gate = MotionGate(FPS) if MOTION_GATED else None
+    last_frame = None
+    num_frames = num_written = 0
     timekeeping = [0, 0]
     # Show the camera input and record video
-    while (capture.isOpened() and num_frames < DURATION*FPS):
+    while (capture.isOpened() and (num_frames if gate else num_written) < DURATION*FPS):
         timekeeping = [timekeeping[-1], cv2.getTickCount()]
-        ret, frame = capture.read()
+        with metrics.timer("grab"):
+            ret, frame = capture.read(None if gate is None else gate.slot())
         if ret:
+            fills = 0
+            if pacer is not None:
+                fills = pacer.pace(clock.now())
+                if fills is None:
+                    metrics.count("drops")
+                    continue
+                fills = min(fills, DURATION*FPS - num_written - 1)
 
             num_frames += 1
+            metrics.count("frames")
+            if gate is not None:
+                with metrics.timer("motion"):
+                    moving = gate.is_moving(frame)
             # frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
 
-            current_time_seconds = time.time()
-            formatted_time = time.strftime("%Y%m%d_%H%M%S", time.localtime(current_time_seconds))
+            with metrics.timer("overlay"):
+                current_time_seconds = time.time()
+                formatted_time = time.strftime("%Y%m%d_%H%M%S", time.localtime(current_time_seconds))
 
-            text = formatted_time + f"{current_time_seconds :.3f} "[-4:] + f"{WIDTH}x"\
-                   f"{HEIGHT}@{FPS}fps. Frame #{num_frames}. Sampling rate: "\
-                   f"{round(cv2.getTickFrequency()/(timekeeping[-1]-timekeeping[0]), 3)} fps"
+                text = formatted_time + f"{current_time_seconds :.3f} "[-4:] + f"{WIDTH}x"\
+                       f"{HEIGHT}@{FPS}fps. Frame #{num_frames}. Sampling rate: "\
+                       f"{round(cv2.getTickFrequency()/(timekeeping[-1]-timekeeping[0]), 3)} fps"
 
-            frame = put_text(frame, text, font_scale, font_thickness)
+                frame = put_text(frame, text, font_scale, font_thickness)
 
             #cv2.imshow("Camera Feed", frame)
-            # Write each frame to the video file
-            video_writer.write(frame)
-            print(f"Process {os.getpid()} writing #{num_frames} frame.")
-            # print({num_frames})
+            if gate is not None:
+                frames = gate.update(frame, moving)
+                if not frames:
+                    metrics.count("idle_frames")
+                    metrics.tick()
+                    continue
+            else:
+                frames = [last_frame] * fills + [frame]
+
+            # Encode and write each frame to the video file
+            with metrics.timer("write"):
+                for written_frame in frames:
+                    video_writer.write(written_frame)
+            last_frame = frame
+            num_written += len(frames)
+            if fills:
+                metrics.count("fills", fills)
+            metrics.tick()
 
             # key = cv2.waitKey(1)
             # if key == ord('q') or num_frames == 120:
             # if num_frames == 60:
                 # print("")
                 # break
+        else:
+            metrics.count("grab_failures")
 
     # Release the capture, video writer, and close all windows
+    metrics.summary()
+    if pacer is not None:
+        print(f"Captured {num_frames} frames, wrote {num_written}: {pacer.fills} repeated to fill gaps, "
+              f"{pacer.drops} dropped")
+    if gate is not None:
+        print(f"Captured {num_frames} frames, wrote {num_written} in {gate.events} motion events")
     capture.release()
+    video_writer.release()
     cv2.destroyAllWindows()
 
 
 if __name__ == "__main__":
-    # Open capture
-    capture = cv2.VideoCapture(CAMERA_INDEX)
-    capture.set(cv2.CAP_PROP_FOURCC, FOURCC)
-    capture.set(cv2.CAP_PROP_FRAME_WIDTH, WIDTH)
-    capture.set(cv2.CAP_PROP_FRAME_HEIGHT, HEIGHT)
-    capture.set(cv2.CAP_PROP_FPS, FPS)
-    scaling = int(max(capture.get(cv2.CAP_PROP_FRAME_WIDTH)/1920, 1))
-    font=cv2.FONT_HERSHEY_SIMPLEX
-    color = (0, 255, 0)
-    font_scale = scaling
-    font_thickness = 2*scaling
     main()
         
\ No newline at end of file
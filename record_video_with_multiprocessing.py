@@ -5,6 +5,9 @@ import time
 import multiprocessing
 import cv2
 
+from metrics import Metrics
+from video_writers import open_writer
+
 
 # Set capture index, resolution, frame rate, duration and video type
 CAMERA_INDEX = 2            # {0, 2}
@@ -19,6 +22,14 @@ OUTPUT_VIDEO_FILE = f"videos/{TIMESTAMP}_{RESOLUTION}@{FPS}.{VIDEO_TYPE}"
 CODEC = {'avi': 'MJPG', 'mp4': 'H264'}
 FOURCC = cv2.VideoWriter_fourcc(*CODEC[VIDEO_TYPE])         # type: ignore
 
+# Video writer backend: "opencv" (cv2.VideoWriter) or "ffmpeg" (raw frames piped to an ffmpeg process)
+WRITER_BACKEND = 'opencv'
+WRITER_OPTIONS = {}         # ffmpeg only, e.g. {"preset": "veryfast", "threads": 4, "crf": 23}
+
+# Per-stage timing, periodic summary line and optional export (.json or Prometheus text)
+METRICS_ENABLED = True
+METRICS_FILE = None         # e.g. "videos/record_video.prom", one file per process role
+
 # Standard video resolutions, scaling
 STD_RESOLUTIONS =  {
     "360p": (640, 360),
@@ -30,17 +41,25 @@ STD_RESOLUTIONS =  {
     "4K": (3840, 2160)}
 WIDTH, HEIGHT = STD_RESOLUTIONS[RESOLUTION][0], STD_RESOLUTIONS[RESOLUTION][1]
 
-# Open capture
-capture = cv2.VideoCapture(CAMERA_INDEX)
-capture.set(cv2.CAP_PROP_FOURCC, FOURCC)
-capture.set(cv2.CAP_PROP_FRAME_WIDTH, WIDTH)
-capture.set(cv2.CAP_PROP_FRAME_HEIGHT, HEIGHT)
-capture.set(cv2.CAP_PROP_FPS, FPS)
-scaling = int(max(capture.get(cv2.CAP_PROP_FRAME_WIDTH)/1920, 1))
-font=cv2.FONT_HERSHEY_SIMPLEX
+# Text overlay, scaled to the capture resolution by open_capture
+font = cv2.FONT_HERSHEY_SIMPLEX
 color = (0, 255, 0)
-font_scale = scaling
-font_thickness = 2*scaling
+scaling = font_scale = 1
+font_thickness = 2
+
+
+def open_capture():
+    """Open the camera and scale the text overlay to its resolution"""
+    global scaling, font_scale, font_thickness
+    capture = cv2.VideoCapture(CAMERA_INDEX)
+    capture.set(cv2.CAP_PROP_FOURCC, FOURCC)
+    capture.set(cv2.CAP_PROP_FRAME_WIDTH, WIDTH)
+    capture.set(cv2.CAP_PROP_FRAME_HEIGHT, HEIGHT)
+    capture.set(cv2.CAP_PROP_FPS, FPS)
+    scaling = int(max(capture.get(cv2.CAP_PROP_FRAME_WIDTH)/1920, 1))
+    font_scale = scaling
+    font_thickness = 2*scaling
+    return capture
 
 
 def put_text(frame, text, f_scale, thickness):
@@ -83,44 +102,65 @@ def put_text(frame, text, f_scale, thickness):
     return frame
 
 
+def metrics_file(role):
+    """Export file of one process role"""
+    if METRICS_FILE is None:
+        return None
+    root, ext = os.path.splitext(METRICS_FILE)
+    return f"{root}_{role}{ext}"
+
+
 def read_frames(queue, stop_event):
     """Read frames"""
 
+    # The camera is opened here, in the reading process only
+    capture = open_capture()
+    metrics = Metrics(f"read {os.getpid()}", METRICS_ENABLED, export_file=metrics_file("read"))
     read_frame_count = 0
     # while (capture.isOpened() and read_frame_count < DURATION*FPS and
         #    (cv2.getTickCount() - timekeeping)/cv2.getTickFrequency() <= 1/FPS):
     while capture.isOpened() and read_frame_count < DURATION*FPS:
         timekeeping = cv2.getTickCount()
-        ret, image = capture.read()
+        with metrics.timer("grab"):
+            ret, image = capture.read()
         if not ret:
             break
         # image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
         read_frame_count += 1
-        formatted_time = time.strftime("%H:%M:%S", time.localtime(time.time()))
-        text = f"RESOLUTION: {image.shape[1]}x{image.shape[0]}. FPS: {FPS}. " \
-               f"FRAME: {read_frame_count}. TIME: {formatted_time}" +\
-               f"{time.time():.3f}"[-4:] + f". PROCESS ID: {os.getpid()}. " \
-               f"READING RATE: {round(cv2.getTickFrequency()/(cv2.getTickCount()-timekeeping), 3)} fps."
-
-        image = put_text(image, text, font_scale, font_thickness)
-        queue.put(image)
-        print(f"Process {os.getpid()} reading #{read_frame_count} frame.")
-
+        with metrics.timer("overlay"):
+            formatted_time = time.strftime("%H:%M:%S", time.localtime(time.time()))
+            text = f"RESOLUTION: {image.shape[1]}x{image.shape[0]}. FPS: {FPS}. " \
+                   f"FRAME: {read_frame_count}. TIME: {formatted_time}" +\
+                   f"{time.time():.3f}"[-4:] + f". PROCESS ID: {os.getpid()}. " \
+                   f"READING RATE: {round(cv2.getTickFrequency()/(cv2.getTickCount()-timekeeping), 3)} fps."
+
+            image = put_text(image, text, font_scale, font_thickness)
+        with metrics.timer("queue_put"):
+            queue.put(image)
+        metrics.count("frames")
+        metrics.tick()
+
+    metrics.summary()
     capture.release()
     stop_event.set()  # Signal that capture is complete
 
-def write_frames(queue, stop_event):
+def write_frames(queue, stop_event, output_file):
     """Write frames"""
-    out = cv2.VideoWriter(OUTPUT_VIDEO_FILE, FOURCC, FPS, (WIDTH, HEIGHT))
+    out = open_writer(output_file, FPS, (WIDTH, HEIGHT), WRITER_BACKEND, CODEC[VIDEO_TYPE], **WRITER_OPTIONS)
+    metrics = Metrics(f"write {os.getpid()}", METRICS_ENABLED, export_file=metrics_file("write"))
     write_frame_count = 0
 
     while not stop_event.is_set() or not queue.empty():
         if not queue.empty():
-            frame = queue.get()
-            out.write(frame)
+            with metrics.timer("queue_get"):
+                frame = queue.get()
+            with metrics.timer("write"):
+                out.write(frame)
             write_frame_count += 1
-            print(f"Process {os.getpid()} writing #{write_frame_count} frame.")
+            metrics.count("frames")
+            metrics.tick()
 
+    metrics.summary()
     out.release()
 
 if __name__ == "__main__":
@@ -128,7 +168,8 @@ if __name__ == "__main__":
     stop = multiprocessing.Event()
 
     read_process = multiprocessing.Process(target=read_frames, args=(frame_queue, stop,))
-    write_process = multiprocessing.Process(target=write_frames, args=(frame_queue, stop,))
+    # Pass the file name, spawned children would otherwise compute their own TIMESTAMP
+    write_process = multiprocessing.Process(target=write_frames, args=(frame_queue, stop, OUTPUT_VIDEO_FILE,))
 
     read_process.start()
     write_process.start()
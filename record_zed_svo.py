@@ -18,28 +18,119 @@
 #
 ########################################################################
 
+import os
 import sys
-import pyzed.sl as sl
+import time
+import argparse
+import threading
 from signal import signal, SIGINT
-import argparse 
-import os 
 
-cam = sl.Camera()
+from metrics import Metrics
 
-#Handler to deal with CTRL+C properly
-def handler(signal_received, frame):
-    cam.disable_recording()
-    cam.close()
-    sys.exit(0)
 
-signal(SIGINT, handler)
+NUMBER_OF_FRAMES = 300      # frames to record when neither a frame count nor a duration is given
+CAMERA_FPS = 30
+GAP_TOLERANCE = 1.5         # an interval above GAP_TOLERANCE frame periods between image timestamps marks skipped frames
+MAX_GRAB_FAILURES = 30      # consecutive grab failures after which recording stops
+
+
+def load_sdk(simulate=False):
+    """The pyzed.sl module, or the simulated camera of zed_mock_sdk"""
+    if simulate:
+        import zed_mock_sdk
+        return zed_mock_sdk
+    import pyzed.sl as sl
+    return sl
+
+
+def skipped_frames_path(svo_path):
+    """Sidecar file listing the frames the camera skipped during a recording"""
+    return f"{os.path.splitext(svo_path)[0]}_skipped.csv"
+
+
+class SVORecorder(threading.Thread):
+    """
+    Grab (and so encode into the SVO) on a dedicated thread until a frame count or a duration, in
+    SDK image time, is reached. Gaps between the image timestamps are written to a sidecar with one
+    line per gap: the frame recorded after it, its timestamp (ns) and the number of skipped frames.
+    """
+
+    def __init__(self, sl, cam, svo_path, fps, max_frames=None, duration=None, metrics=None):
+        super().__init__(name="zed-grab", daemon=True)
+        self.sl = sl
+        self.cam = cam
+        self.period_ns = 1e9 / fps
+        self.max_frames = max_frames
+        self.duration_ns = duration * 1e9 if duration is not None else None
+        self.sidecar_path = skipped_frames_path(svo_path)
+        self.metrics = metrics or Metrics("record_zed_svo", False)
+        self.stop_event = threading.Event()
+        self.frames = 0
+        self.skipped = 0
+        self.gaps = 0
+        self.first_timestamp = None
+        self.last_timestamp = None
+
+    def stop(self):
+        self.stop_event.set()
+
+    def done(self):
+        if self.stop_event.is_set() or (self.max_frames is not None and self.frames >= self.max_frames):
+            return True
+        # Each frame covers one period, half a period absorbs the rounding of the timestamps
+        return (self.duration_ns is not None and self.last_timestamp is not None
+                and self.last_timestamp - self.first_timestamp + 1.5 * self.period_ns > self.duration_ns)
+
+    def run(self):
+        sl, cam, metrics = self.sl, self.cam, self.metrics
+        runtime = sl.RuntimeParameters()
+        failures = 0
+        with open(self.sidecar_path, "w") as sidecar:
+            sidecar.write("frame,timestamp_ns,skipped\n")
+            while not self.done():
+                with metrics.timer("grab_and_encode"): # grab also compresses and writes the frame to the SVO
+                    err = cam.grab(runtime)
+                if err != sl.ERROR_CODE.SUCCESS:
+                    failures += 1
+                    metrics.count("grab_failures")
+                    if failures >= MAX_GRAB_FAILURES:
+                        print(f"Stopping after {failures} consecutive grab failures: {err}")
+                        break
+                    continue
+                failures = 0
+
+                timestamp = cam.get_timestamp(sl.TIME_REFERENCE.IMAGE).get_nanoseconds()
+                if self.first_timestamp is None:
+                    self.first_timestamp = timestamp
+                elif timestamp - self.last_timestamp > GAP_TOLERANCE * self.period_ns:
+                    skipped = round((timestamp - self.last_timestamp) / self.period_ns) - 1
+                    sidecar.write(f"{self.frames},{timestamp},{skipped}\n")
+                    self.skipped += skipped
+                    self.gaps += 1
+                    metrics.count("skipped", skipped)
+                self.last_timestamp = timestamp
+
+                # Frames the encoder did not write, or encoded slower than the frame rate
+                status = cam.get_recording_status()
+                if not status.status:
+                    metrics.count("not_written")
+                elif status.current_compression_time * 1e6 > self.period_ns:
+                    metrics.count("slow_encodes")
+
+                self.frames += 1
+                metrics.count("frames")
+                metrics.tick()
+
+
+def main(opt):
+    sl = load_sdk(opt.simulate)
+
+    cam = sl.Camera()
 
-def main():
-    
     init = sl.InitParameters()
     init.depth_mode = sl.DEPTH_MODE.NONE # Set configuration parameters for the ZED
     init.camera_resolution = sl.RESOLUTION.HD1080 # Use HD720 opr HD1200 video mode, depending on camera type.
-    init.camera_fps = 30  # Set fps at 30
+    init.camera_fps = CAMERA_FPS  # Set fps at 30
 
     status = cam.open(init) 
     if status != sl.ERROR_CODE.SUCCESS: 
@@ -52,28 +143,42 @@ def main():
         print("Recording ZED : ", err)
         exit(1)
 
-    runtime = sl.RuntimeParameters()
-    print("SVO is Recording, use Ctrl-C to stop.") # Start recording SVO, stop with Ctrl-C command
-    frames_recorded = 0
+    max_frames = opt.number_of_frames
+    if max_frames is None and opt.duration is None:
+        max_frames = NUMBER_OF_FRAMES
+
+    metrics = Metrics("record_zed_svo", not opt.no_metrics, export_file=opt.metrics_file)
+    recorder = SVORecorder(sl, cam, opt.output_svo_file, CAMERA_FPS, max_frames, opt.duration, metrics)
 
-    if opt.number_of_frames is not None:
-        max_frame_limit = opt.number_of_frames
-    else:
-        max_frame_limit = 300
+    #Handler to deal with CTRL+C properly: the grab thread finishes its frame before the recording is closed
+    def handler(signal_received, frame):
+        recorder.stop()
+
+    signal(SIGINT, handler)
+
+    print("SVO is Recording, use Ctrl-C to stop.") # Start recording SVO, stop with Ctrl-C command
+    start_time = time.perf_counter()
+    recorder.start()
+    while recorder.is_alive():
+        recorder.join(0.2)
+    elapsed = time.perf_counter() - start_time
 
-    while frames_recorded <= max_frame_limit:
-        if cam.grab(runtime) == sl.ERROR_CODE.SUCCESS : # Check that a new image is successfully acquired
-            frames_recorded += 1
-            print("Frame count: " + str(frames_recorded), end="\r")
+    metrics.summary()
     cam.disable_recording()
     cam.close()
+    print(f"Recorded {recorder.frames} frames in {elapsed:.1f} s ({recorder.frames / max(elapsed, 1e-9):.1f} fps), "
+          f"{recorder.skipped} skipped in {recorder.gaps} gaps, listed in {recorder.sidecar_path}")
     
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument('--number_of_frames', type=int, help='Number of frames to be recorded', required= False)
+    parser.add_argument('--duration', type=float, help='Seconds to record, in camera time', required= False)
     parser.add_argument('--output_svo_file', type=str, help='Path to the SVO file that will be written', required= True)
+    parser.add_argument('--metrics_file', type=str, help='Path to export metrics to (.json or Prometheus text)', default=None)
+    parser.add_argument('--no_metrics', action='store_true', help='Disable timing and the periodic summary line')
+    parser.add_argument('--simulate', action='store_true', help='Record from a simulated camera (zed_mock_sdk)')
     opt = parser.parse_args()
     if not opt.output_svo_file.endswith(".svo"): 
         print("--output_svo_file parameter should be a .svo file but is not : ",opt.output_svo_file,"Exit program.")
         exit()
-    main()
\ No newline at end of file
+    main(opt)
\ No newline at end of file
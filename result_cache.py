@@ -0,0 +1,90 @@
+"""Persistent content-addressed cache for image analysis results."""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+
+
+CACHE_VERSION = 1                   # bump when the cached results change meaning
+MAX_CACHE_BYTES = 512 * 1024**2     # size of the stored results before least recently used ones are evicted
+HASH_CHUNK_SIZE = 1024**2
+
+
+def hash_file(path):
+    """Digest of a file's contents"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    Results keyed by the digest of the input file and the analysis parameters, stored in one SQLite
+    file with size-based LRU eviction. File digests are remembered together with the file's mtime
+    and size, so unchanged files are recognised from a stat() without being read again.
+    """
+
+    def __init__(self, cache_dir, max_bytes=MAX_CACHE_BYTES):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(cache_dir, "results.sqlite"))
+        self.db.execute("CREATE TABLE IF NOT EXISTS files "
+                        "(path TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER, digest TEXT)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS results "
+                        "(key TEXT PRIMARY KEY, data BLOB, nbytes INTEGER, last_access REAL)")
+        self.max_bytes = max_bytes
+        self.total_bytes = self.db.execute("SELECT COALESCE(SUM(nbytes), 0) FROM results").fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+
+    def file_digest(self, path):
+        """Digest of a file's contents, reusing the stored one while mtime and size are unchanged"""
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        row = self.db.execute("SELECT digest FROM files WHERE path = ? AND mtime_ns = ? AND size = ?",
+                              (path, stat.st_mtime_ns, stat.st_size)).fetchone()
+        if row is not None:
+            return row[0]
+        digest = hash_file(path)
+        self.db.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+                        (path, stat.st_mtime_ns, stat.st_size, digest))
+        return digest
+
+    @staticmethod
+    def key(digest, params):
+        """Cache key of a file digest and a dict of analysis parameters"""
+        encoded = json.dumps([CACHE_VERSION, digest, params], sort_keys=True, default=str)
+        return hashlib.blake2b(encoded.encode(), digest_size=16).hexdigest()
+
+    def get(self, key):
+        """Stored result of a key, or None"""
+        row = self.db.execute("SELECT data FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.db.execute("UPDATE results SET last_access = ? WHERE key = ?", (time.time(), key))
+        return json.loads(row[0])
+
+    def put(self, key, result):
+        """Store a JSON-serializable result, evicting the least recently used ones past max_bytes"""
+        data = json.dumps(result).encode()
+        old = self.db.execute("SELECT nbytes FROM results WHERE key = ?", (key,)).fetchone()
+        self.db.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)", (key, data, len(data), time.time()))
+        self.total_bytes += len(data) - (old[0] if old else 0)
+
+        if self.total_bytes > self.max_bytes:
+            evicted = 0
+            for old_key, nbytes in self.db.execute("SELECT key, nbytes FROM results ORDER BY last_access").fetchall():
+                if self.total_bytes - evicted <= self.max_bytes:
+                    break
+                self.db.execute("DELETE FROM results WHERE key = ?", (old_key,))
+                evicted += nbytes
+            self.total_bytes -= evicted
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
@@ -0,0 +1,173 @@
+"""Track the centers of contours across the frames of a video using OpenCV."""
+
+import os
+import csv
+import argparse
+import numpy as np
+import cv2
+
+from find_centers_of_contours_in_images import ENGINES, find_centers
+
+
+# Set tracking parameters
+THRESHOLD = 127             # binary threshold, None for Otsu
+MAX_DISTANCE = 50           # pixels a center may move between frames and keep its track
+MAX_MISSED = 5              # frames a track may go undetected before it is closed
+TRACK_FIELDS = ["track_id", "frame", "timestamp", "cx", "cy", "area"]
+
+
+def candidate_pairs(points, track_points, max_distance):
+    """
+    All (point, track, distance) pairs closer than max_distance, found through a uniform grid
+    with cells of max_distance: only tracks in the 3x3 neighbouring cells of a point are compared.
+    """
+    empty = np.zeros(0, dtype=np.int64)
+    if len(points) == 0 or len(track_points) == 0:
+        return empty, empty, np.zeros(0)
+
+    # Sort the tracks by cell key so each cell is a contiguous range
+    track_cells = np.floor(track_points / max_distance).astype(np.int64)
+    track_keys = (track_cells[:, 0] << 32) + track_cells[:, 1]
+    order = np.argsort(track_keys, kind="stable")
+    sorted_keys = track_keys[order]
+
+    point_cells = np.floor(points / max_distance).astype(np.int64)
+    point_ids, track_ids = [], []
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            keys = ((point_cells[:, 0] + dx) << 32) + point_cells[:, 1] + dy
+            lo = np.searchsorted(sorted_keys, keys, side="left")
+            hi = np.searchsorted(sorted_keys, keys, side="right")
+            counts = hi - lo
+            # Expand every [lo, hi) range into one pair per track
+            repeated = np.repeat(np.arange(len(points)), counts)
+            offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            point_ids.append(repeated)
+            track_ids.append(order[np.repeat(lo, counts) + offsets])
+    point_ids, track_ids = np.concatenate(point_ids), np.concatenate(track_ids)
+
+    distances = np.hypot(*(points[point_ids] - track_points[track_ids]).T)
+    close = distances <= max_distance
+    return point_ids[close], track_ids[close], distances[close]
+
+
+def match(points, track_points, max_distance):
+    """
+    Greedy nearest-neighbour assignment of points to tracks. Mutually nearest pairs are accepted
+    in rounds, which gives the same result as accepting the globally closest pairs one by one.
+    Returns the track index of each point, -1 for unmatched points.
+    """
+    assignment = np.full(len(points), -1, dtype=np.int64)
+    point_ids, track_ids, distances = candidate_pairs(points, track_points, max_distance)
+    order = np.argsort(distances, kind="stable")
+    point_ids, track_ids = point_ids[order], track_ids[order]
+
+    while len(point_ids):
+        # Closest track of each point and closest point of each track
+        _, first_of_point = np.unique(point_ids, return_index=True)
+        _, first_of_track = np.unique(track_ids, return_index=True)
+        mutual = np.intersect1d(first_of_point, first_of_track, assume_unique=True)
+        assignment[point_ids[mutual]] = track_ids[mutual]
+
+        # Drop every pair involving an assigned point or track
+        taken_tracks = np.zeros(len(track_points), dtype=bool)
+        taken_tracks[track_ids[mutual]] = True
+        keep = (assignment[point_ids] < 0) & ~taken_tracks[track_ids]
+        point_ids, track_ids = point_ids[keep], track_ids[keep]
+    return assignment
+
+
+class CentroidTracker:
+    """Link centers between frames, keeping only the active tracks in memory"""
+
+    def __init__(self, max_distance=MAX_DISTANCE, max_missed=MAX_MISSED):
+        self.max_distance = max_distance
+        self.max_missed = max_missed
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.points = np.zeros((0, 2))
+        self.missed = np.zeros(0, dtype=np.int64)
+        self.next_id = 1
+
+    def update(self, points):
+        """Assign a track id to each (cx, cy) point of the new frame"""
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        assignment = match(points, self.points, self.max_distance)
+
+        # Matched tracks move to their new point, unmatched points start new tracks
+        matched = assignment >= 0
+        ids = np.empty(len(points), dtype=np.int64)
+        ids[matched] = self.ids[assignment[matched]]
+        new_count = int((~matched).sum())
+        ids[~matched] = np.arange(self.next_id, self.next_id + new_count)
+        self.next_id += new_count
+
+        seen = np.zeros(len(self.ids), dtype=bool)
+        seen[assignment[matched]] = True
+        self.points[assignment[matched]] = points[matched]
+        self.missed[seen] = 0
+        self.missed[~seen] += 1
+
+        # Close the tracks that have been missing for too long
+        alive = self.missed <= self.max_missed
+        self.ids = np.concatenate((self.ids[alive], ids[~matched]))
+        self.points = np.concatenate((self.points[alive], points[~matched]))
+        self.missed = np.concatenate((self.missed[alive], np.zeros(new_count, dtype=np.int64)))
+        return ids
+
+
+def binarize(frame, threshold=THRESHOLD):
+    """Grayscale and threshold a frame, with Otsu's method if threshold is None"""
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+    if threshold is None:
+        return cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
+    return cv2.threshold(gray, threshold, 255, cv2.THRESH_BINARY)[1]
+
+
+def track_centers_in_video(video_path, output_file, threshold=THRESHOLD, max_distance=MAX_DISTANCE,
+                           max_missed=MAX_MISSED, **params):
+    """Track the centers of a video frame by frame and append each frame's trajectories to a CSV"""
+
+    capture = cv2.VideoCapture(video_path)
+    if not capture.isOpened():
+        raise IOError(f"Cannot open video file {video_path}")
+    tracker = CentroidTracker(max_distance, max_missed)
+    frame_id = 0
+
+    with open(output_file, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(TRACK_FIELDS)
+        while True:
+            ret, frame = capture.read()
+            if not ret:
+                break
+            timestamp = capture.get(cv2.CAP_PROP_POS_MSEC) / 1000
+
+            centers = find_centers(binarize(frame, threshold), **params)
+            points = [(cx, cy) for _, cx, cy, *_ in centers]
+            ids = tracker.update(points)
+            writer.writerows((track_id, frame_id, f"{timestamp:.3f}", cx, cy, area)
+                             for track_id, (_, cx, cy, area, *_) in zip(ids.tolist(), centers))
+            frame_id += 1
+
+    capture.release()
+    print(f"Tracked {tracker.next_id - 1} objects over {frame_id} frames to {output_file}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--input_video', type=str, help='Path to the video', required=True)
+    parser.add_argument('--output_file', type=str, help='Path to the trajectories CSV', default='tracks.csv')
+    parser.add_argument('--threshold', type=int, help='Binary threshold', default=THRESHOLD)
+    parser.add_argument('--otsu', action='store_true', help="Threshold with Otsu's method")
+    parser.add_argument('--max_distance', type=float, help='Maximum center motion between frames',
+                        default=MAX_DISTANCE)
+    parser.add_argument('--max_missed', type=int, help='Frames a track may be missed', default=MAX_MISSED)
+    parser.add_argument('--engine', type=str, choices=list(ENGINES), help='Centroid engine', default='contours')
+    parser.add_argument('--min_area', type=float, help='Minimum object area', default=0)
+    opt = parser.parse_args()
+    if not os.path.isfile(opt.input_video):
+        print("--input_video parameter should be an existing file but is not : ", opt.input_video, "Exit program.")
+        exit()
+    track_centers_in_video(opt.input_video, opt.output_file, None if opt.otsu else opt.threshold,
+                           opt.max_distance, opt.max_missed,
+                           engine=opt.engine, min_area=opt.min_area)
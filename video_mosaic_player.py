@@ -0,0 +1,243 @@
+"""Play several videos of the same session as one synchronized mosaic."""
+
+import os
+import math
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import cv2
+
+from video_timestamps import load_timestamps
+
+
+# Set mosaic parameters
+TILE_SIZE = (640, 360)          # size of each tile in the mosaic (width, height)
+DECODE_WORKERS = os.cpu_count() or 4
+SEEK_SECONDS = 5                # seconds to jump when seeking
+MAX_GRAB_AHEAD = 15             # frames a lagging stream skips by grabbing instead of seeking
+
+video_handling = {'pause' : [ord("p"), ord("P"), ord("π"), ord("Π"), ord(" ")],
+                'forward': [ord("f"), ord("F"), ord("φ"), ord("Φ")],
+                'backward': [ord("b"), ord("B"), ord("β"), ord("Β")],
+                'seek_forward': [ord("."), ord(">")],
+                'seek_backward': [ord(","), ord("<")],
+                'quit' : [ord("q"), ord("Q"), ord(";"), 27]
+                }
+
+
+class VideoStream:
+    """A video decoded in the shared pool and positioned on the mosaic clock"""
+
+    def __init__(self, video_path, pool):
+        self.path = video_path
+        self.name = os.path.basename(video_path)
+        self.pool = pool
+        self.capture = cv2.VideoCapture(video_path)
+        if not self.capture.isOpened():
+            raise IOError(f"Cannot open video file {video_path}")
+        self.fps = self.capture.get(cv2.CAP_PROP_FPS) or 30
+        self.total_frames = int(self.capture.get(cv2.CAP_PROP_FRAME_COUNT))
+
+        # Absolute timestamps from the sidecar, or frame times derived from FPS
+        self.timestamps = load_timestamps(video_path)
+        self.has_sidecar = self.timestamps is not None
+        if not self.has_sidecar and self.total_frames <= 0:
+            # No frame count from the backend (e.g. an AVI still being written): count the frames once
+            self.total_frames = self._count_frames()
+        if self.timestamps is not None and self.total_frames:
+            self.timestamps = self.timestamps[:self.total_frames]
+        if self.timestamps is None:
+            self.timestamps = np.arange(self.total_frames, dtype=np.float64) / self.fps
+
+        self.next_position = 0      # frame the capture will decode next
+        self.index = -1             # frame currently shown
+        self.tile = np.zeros((TILE_SIZE[1], TILE_SIZE[0], 3), dtype=np.uint8)
+        self.pending = None         # (index, future) of the frame being decoded
+
+    def _count_frames(self):
+        """Count the frames by grabbing through the video, then reopen it at the first frame"""
+        count = 0
+        while self.capture.grab():
+            count += 1
+        self.capture.release()
+        self.capture = cv2.VideoCapture(self.path)
+        return count
+
+    def start_at_zero(self):
+        """Shift the timeline so that the first frame is at 0 s"""
+        if len(self.timestamps):
+            self.timestamps = self.timestamps - self.timestamps[0]
+
+    @property
+    def start_time(self):
+        return self.timestamps[0]
+
+    @property
+    def end_time(self):
+        return self.timestamps[-1]
+
+    def index_at(self, t):
+        """Last frame whose timestamp is not later than t (-1 if before the start)"""
+        return int(np.searchsorted(self.timestamps, t, side="right")) - 1
+
+    def _decode(self, index):
+        """Decode frame `index` and downscale it to a tile (runs in the pool)"""
+        gap = index - self.next_position
+        if 0 < gap <= MAX_GRAB_AHEAD:
+            # Skip a few frames without converting them rather than seeking
+            for _ in range(gap):
+                self.capture.grab()
+        elif gap != 0:
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, index)
+        ret, frame = self.capture.read()
+        self.next_position = index + 1
+        if not ret:
+            return None
+        tile = cv2.resize(frame, TILE_SIZE, interpolation=cv2.INTER_AREA)
+        cv2.putText(tile, f"{self.name} | Frame #{index}", (10, 25),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 240, 0), 1, cv2.LINE_AA)
+        return tile
+
+    def _submit(self, index):
+        self.pending = (index, self.pool.submit(self._decode, index))
+
+    def update(self, t, block=False):
+        """Move towards the frame at time t without waiting on the decoder,
+        unless `block` is set (used when paused, stepping or seeking)"""
+        target = self.index_at(t)
+        if target < 0:
+            return
+        if self.pending is not None:
+            pending_index, future = self.pending
+            if not block and not future.done():
+                return
+            tile = future.result()
+            if pending_index == self.index + 1 and self.index == target:
+                # Prefetched frame is not due yet
+                return
+            self.pending = None
+            if tile is None:
+                # The container holds fewer frames than reported
+                self.timestamps = self.timestamps[:max(pending_index, 1)]
+                target = self.index_at(t)
+            elif pending_index <= target:
+                self.index, self.tile = pending_index, tile
+        if self.index != target:
+            self._submit(target)
+            if block:
+                self.update(t, block=True)
+        elif self.index + 1 < len(self.timestamps):
+            # Prefetch the next frame while the current one is shown
+            self._submit(self.index + 1)
+
+    def release(self):
+        if self.pending is not None:
+            self.pending[1].result()
+        self.capture.release()
+
+
+def build_mosaic(streams, canvas):
+    """Tile the current frame of each stream into the canvas"""
+    cols = math.ceil(math.sqrt(len(streams)))
+    tile_w, tile_h = TILE_SIZE
+    for i, stream in enumerate(streams):
+        row, col = divmod(i, cols)
+        canvas[row*tile_h:(row+1)*tile_h, col*tile_w:(col+1)*tile_w] = stream.tile
+    return canvas
+
+
+def main(video_paths):
+    """Main function"""
+
+    pool = ThreadPoolExecutor(max_workers=min(DECODE_WORKERS, 2*len(video_paths)))
+    streams = []
+    for path in video_paths:
+        stream = VideoStream(path, pool)
+        if len(stream.timestamps):
+            streams.append(stream)
+        else:
+            print(f"No frames found in {path}, it is left out of the mosaic")
+            stream.release()
+    if not streams:
+        print("None of the videos has frames to play. Exit program.")
+        pool.shutdown()
+        return
+
+    # Sidecar timestamps are absolute (e.g. seconds since the epoch) while FPS-derived ones start at 0, so
+    # the streams only share a clock if every one has a sidecar; otherwise each one starts at 0
+    if not all(stream.has_sidecar for stream in streams):
+        if any(stream.has_sidecar for stream in streams):
+            missing = ", ".join(stream.name for stream in streams if not stream.has_sidecar)
+            print(f"No timestamps sidecar for {missing}: every video is played from its own start")
+        for stream in streams:
+            stream.start_at_zero()
+
+    # Align all streams on a shared clock starting at the earliest frame
+    session_start = min(stream.start_time for stream in streams)
+    session_end = max(stream.end_time for stream in streams)
+    frame_period = 1 / max(stream.fps for stream in streams)
+
+    cols = math.ceil(math.sqrt(len(streams)))
+    rows = math.ceil(len(streams) / cols)
+    canvas = np.zeros((rows*TILE_SIZE[1], cols*TILE_SIZE[0], 3), dtype=np.uint8)
+
+    t = session_start
+    paused = False
+    last_tick = time.perf_counter()
+    block = True
+
+    while True:
+        now = time.perf_counter()
+        if not paused:
+            t += now - last_tick
+            if t > session_end:
+                # Repeat the loop if the end of the session is reached
+                t = session_start
+                block = True
+        last_tick = now
+
+        for stream in streams:
+            stream.update(t, block=block)
+        block = paused
+
+        mosaic = build_mosaic(streams, canvas)
+        cv2.putText(mosaic, f"Session time: {t - session_start:.3f} s", (10, mosaic.shape[0] - 15),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 240, 0), 1, cv2.LINE_AA)
+        cv2.imshow('Mosaic', mosaic)
+
+        key = cv2.waitKey(1)
+        # Pause all streams if 'p' or 'P' or Space character is pressed
+        if key in video_handling["pause"]:
+            paused = not paused
+            block = paused
+        # Step all streams backwards or forwards by one frame if 'b'/'B' or 'f'/'F' is pressed
+        elif key in video_handling["forward"] or key in video_handling["backward"]:
+            paused = block = True
+            step = frame_period if key in video_handling["forward"] else -frame_period
+            t = min(max(t + step, session_start), session_end)
+        # Seek all streams by SEEK_SECONDS if '.' or ',' is pressed
+        elif key in video_handling["seek_forward"] or key in video_handling["seek_backward"]:
+            block = True
+            step = SEEK_SECONDS if key in video_handling["seek_forward"] else -SEEK_SECONDS
+            t = min(max(t + step, session_start), session_end)
+        # Break the loop if 'q' or 'Q' or Esc character is pressed
+        elif key in video_handling["quit"]:
+            break
+
+    # Release the videos and the decode pool and close the display window
+    for stream in streams:
+        stream.release()
+    pool.shutdown()
+    cv2.destroyAllWindows()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('videos', type=str, nargs='+', help='Paths to the videos of the same session')
+    opt = parser.parse_args()
+    for path in opt.videos:
+        if not os.path.isfile(path):
+            print("Video file should be an existing file but is not : ", path, "Exit program.")
+            exit()
+    main(opt.videos)
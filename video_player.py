@@ -1,16 +1,12 @@
 """Play and control a video frame by frame"""
 
+import argparse
 import cv2
 
 
 # Set control parameters
 VIDEO_PATH = "/Captures/sample.avi"
 
-capture = cv2.VideoCapture(VIDEO_PATH)
-# [fps] and total frames of video
-CAMERA_FPS = round(capture.get(5))
-TOTAL_FRAMES = capture.get(cv2.CAP_PROP_FRAME_COUNT)
-
 video_handling = {'pause' : [ord("p"), ord("P"), ord("π"), ord("Π"), ord(" ")],
                 'forward': [ord("f"), ord("F"), ord("φ"), ord("Φ")],
                 'backward': [ord("b"), ord("B"), ord("β"), ord("Β")],
@@ -46,9 +42,13 @@ def show_video(video):
         video.set(cv2.CAP_PROP_POS_FRAMES, 0)
 
 
-def main():
+def main(video_path=VIDEO_PATH):
     """Main function"""
 
+    capture = cv2.VideoCapture(video_path)
+    # Total frames of video
+    total_frames = capture.get(cv2.CAP_PROP_FRAME_COUNT)
+
     # Loop through the video frames
     while capture.isOpened():
 
@@ -65,7 +65,7 @@ def main():
                 new_position_frame = -2+int(capture.get(cv2.CAP_PROP_POS_FRAMES))
             else:
                 new_position_frame = 0+int(capture.get(cv2.CAP_PROP_POS_FRAMES))
-            new_position_frame %= (TOTAL_FRAMES+1-0)
+            new_position_frame %= (total_frames+1-0)
             capture.set(cv2.CAP_PROP_POS_FRAMES, new_position_frame)
             show_video(capture)
             key = cv2.waitKey(-1)
@@ -78,4 +78,7 @@ def main():
     cv2.destroyAllWindows()
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('video_path', type=str, nargs='?', help='Path to the video', default=VIDEO_PATH)
+    opt = parser.parse_args()
+    main(opt.video_path)
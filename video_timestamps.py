@@ -0,0 +1,31 @@
+"""Per-frame timestamps sidecar files recorded next to videos."""
+
+import os
+import numpy as np
+
+
+TIMESTAMPS_SUFFIX = "_timestamps.csv"
+
+
+def timestamps_path(video_path):
+    """Path of the timestamps sidecar recorded next to a video"""
+    return os.path.splitext(video_path)[0] + TIMESTAMPS_SUFFIX
+
+
+def open_timestamps(video_path):
+    """Create the timestamps sidecar of a video, write one "frame,timestamp" row per written frame"""
+    sidecar = open(timestamps_path(video_path), "w")
+    sidecar.write("frame,timestamp\n")
+    return sidecar
+
+
+def load_timestamps(video_path):
+    """Load the per-frame capture timestamps (seconds) of a video, if recorded"""
+    sidecar = timestamps_path(video_path)
+    if not os.path.isfile(sidecar):
+        return None
+    # One "frame,timestamp" row per written frame, with a header line
+    data = np.loadtxt(sidecar, delimiter=",", skiprows=1, ndmin=2)
+    if data.size == 0:
+        return None
+    return data[:, 1].astype(np.float64)
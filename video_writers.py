@@ -0,0 +1,105 @@
+"""Video writer backends: OpenCV's VideoWriter and a raw-frame pipe to an ffmpeg subprocess."""
+
+import subprocess
+import numpy as np
+import cv2
+
+
+FFMPEG_BINARY = "ffmpeg"
+# ffmpeg encoders matching the OpenCV FourCC codes used by the scripts
+FFMPEG_CODECS = {"MJPG": "mjpeg", "H264": "libx264", "mp4v": "mpeg4", "M4S2": "mpeg4", "HEVC": "libx265"}
+
+
+class OpenCVWriter:
+    """cv2.VideoWriter with a codec given by its FourCC name"""
+
+    def __init__(self, path, fps, frame_size, codec="MJPG", is_color=True):
+        self.writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*codec), fps, frame_size, is_color)
+
+    def isOpened(self):
+        return self.writer.isOpened()
+
+    def write(self, frame):
+        self.writer.write(frame)
+
+    def release(self):
+        self.writer.release()
+
+
+class FFmpegWriter:
+    """
+    Stream raw frames over a pipe to an ffmpeg subprocess, which gives control over the encoder,
+    its preset, rate control (crf or bitrate) and thread count. Contiguous frames are written
+    straight from their buffer, without copies.
+    """
+
+    def __init__(self, path, fps, frame_size, codec="H264", preset=None, threads=0, crf=None, bitrate=None,
+                 input_pix_fmt="bgr24", output_pix_fmt="yuv420p", extra_args=()):
+        encoder = FFMPEG_CODECS.get(codec, codec)
+        width, height = frame_size
+        command = [FFMPEG_BINARY, "-loglevel", "error", "-y",
+                   "-f", "rawvideo", "-pix_fmt", input_pix_fmt, "-s", f"{width}x{height}", "-r", str(fps),
+                   "-i", "-", "-c:v", encoder, "-threads", str(threads)]
+        if preset is not None:
+            command += ["-preset", preset]
+        if crf is not None:
+            command += ["-crf", str(crf)]
+        if bitrate is not None:
+            command += ["-b:v", str(bitrate)]
+        if encoder == "mjpeg":
+            # Full-range 4:2:0 as MJPEG expects, and near-lossless quality unless a bitrate is given
+            command += ["-pix_fmt", "yuvj420p"] + (["-q:v", "2"] if bitrate is None else [])
+        elif output_pix_fmt is not None:
+            command += ["-pix_fmt", output_pix_fmt]
+        command += list(extra_args) + [path]
+
+        self.command = command
+        self.frame_bytes = width * height * (1 if input_pix_fmt == "gray" else 3)
+        try:
+            self.process = subprocess.Popen(command, stdin=subprocess.PIPE)
+        except FileNotFoundError:
+            raise IOError(f"Cannot run {FFMPEG_BINARY}, install ffmpeg or set video_writers.FFMPEG_BINARY")
+
+    def isOpened(self):
+        return self.process.poll() is None
+
+    def write(self, frame):
+        if frame.nbytes != self.frame_bytes:
+            raise ValueError(f"Frame of {frame.nbytes} bytes, the writer expects {self.frame_bytes}")
+        if not frame.flags.c_contiguous:
+            frame = np.ascontiguousarray(frame)
+        try:
+            self.process.stdin.write(frame.data)
+        except BrokenPipeError:
+            raise IOError(f"ffmpeg exited with code {self.process.poll()}: {' '.join(self.command)}")
+
+    def release(self):
+        if self.process.stdin and not self.process.stdin.closed:
+            try:
+                self.process.stdin.close()
+            except BrokenPipeError:
+                pass
+        self.process.wait()
+
+
+# Writer backends selectable by name
+BACKENDS = {"opencv": OpenCVWriter, "ffmpeg": FFmpegWriter}
+
+
+def open_writer(path, fps, frame_size, backend="opencv", codec="MJPG", **options):
+    """Open a video writer of the chosen backend, options are passed to the backend (e.g. preset, threads)"""
+    return BACKENDS[backend](path, fps, frame_size, codec, **options)
+
+
+def add_writer_arguments(parser):
+    """Add the writer backend and ffmpeg encoder arguments to an argparse parser"""
+    parser.add_argument('--writer_backend', type=str, choices=list(BACKENDS), default="opencv",
+                        help='Video writer: cv2.VideoWriter or a pipe to ffmpeg')
+    parser.add_argument('--preset', type=str, default=None, help='ffmpeg encoder preset, e.g. veryfast')
+    parser.add_argument('--threads', type=int, default=None, help='ffmpeg encoder threads (0: automatic)')
+    parser.add_argument('--crf', type=int, default=None, help='ffmpeg constant rate factor (x264/x265)')
+
+
+def writer_options(opt):
+    """Backend options given on the command line by add_writer_arguments"""
+    return {name: getattr(opt, name) for name in ("preset", "threads", "crf") if getattr(opt, name) is not None}
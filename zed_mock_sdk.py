@@ -0,0 +1,149 @@
+"""Simulated ZED camera behind the subset of the pyzed.sl API used by the recording script."""
+
+import time
+from enum import Enum
+
+
+CAMERA_FPS = 30
+DROP_EVERY = 0              # also skip one frame in every DROP_EVERY (0: only when grab is called late)
+COMPRESSION_TIME_MS = 8.0   # simulated H264 encoding time per frame
+
+
+class ERROR_CODE(Enum):
+    SUCCESS = 0
+    FAILURE = 1
+    CAMERA_NOT_DETECTED = 3
+    INVALID_FUNCTION_CALL = 22
+
+
+class DEPTH_MODE(Enum):
+    NONE = 0
+    PERFORMANCE = 1
+
+
+class RESOLUTION(Enum):
+    HD2K = 0
+    HD1080 = 1
+    HD1200 = 2
+    HD720 = 3
+    VGA = 6
+
+
+class SVO_COMPRESSION_MODE(Enum):
+    LOSSLESS = 0
+    H264 = 1
+    H265 = 2
+
+
+class TIME_REFERENCE(Enum):
+    IMAGE = 0
+    CURRENT = 1
+
+
+class InitParameters:
+    def __init__(self):
+        self.depth_mode = DEPTH_MODE.PERFORMANCE
+        self.camera_resolution = RESOLUTION.HD720
+        self.camera_fps = 0
+
+
+class RuntimeParameters:
+    pass
+
+
+class RecordingParameters:
+    def __init__(self, video_filename="", compression_mode=SVO_COMPRESSION_MODE.H264):
+        self.video_filename = video_filename
+        self.compression_mode = compression_mode
+
+
+class RecordingStatus:
+    def __init__(self):
+        self.is_recording = False
+        self.is_paused = False
+        self.status = False                  # whether the last grabbed frame was written
+        self.current_compression_time = 0.0  # ms
+        self.current_compression_ratio = 0.0
+        self.average_compression_time = 0.0
+        self.average_compression_ratio = 0.0
+
+
+class Timestamp:
+    def __init__(self, nanoseconds=0):
+        self.data_ns = nanoseconds
+
+    def get_nanoseconds(self):
+        return self.data_ns
+
+    def get_milliseconds(self):
+        return self.data_ns // 1000000
+
+
+class Camera:
+    """Camera delivering frames at camera_fps; periods that pass without a grab are skipped frames"""
+
+    def __init__(self):
+        self.opened = False
+        self.fps = CAMERA_FPS
+        self.frame_number = -1
+        self.image_timestamp = 0
+        self.recording = RecordingStatus()
+        self.output_file = None
+        self.recorded = 0
+
+    def open(self, init):
+        if self.opened:
+            return ERROR_CODE.INVALID_FUNCTION_CALL
+        self.fps = init.camera_fps or CAMERA_FPS
+        self.start_time = time.perf_counter()
+        self.opened = True
+        return ERROR_CODE.SUCCESS
+
+    def is_opened(self):
+        return self.opened
+
+    def enable_recording(self, params):
+        if not self.opened or not params.video_filename.endswith(".svo"):
+            return ERROR_CODE.INVALID_FUNCTION_CALL
+        self.output_file = open(params.video_filename, "wb")
+        self.recording.is_recording = True
+        return ERROR_CODE.SUCCESS
+
+    def grab(self, runtime=None):
+        if not self.opened:
+            return ERROR_CODE.CAMERA_NOT_DETECTED
+        now = time.perf_counter()
+        frame_number = max(self.frame_number + 1, int((now - self.start_time) * self.fps))
+        if DROP_EVERY and frame_number % DROP_EVERY == DROP_EVERY - 1:
+            frame_number += 1
+        due = self.start_time + frame_number / self.fps
+        if due > now:
+            time.sleep(due - now)
+        self.frame_number = frame_number
+        self.image_timestamp = int(due * 1e9)
+        if self.recording.is_recording:
+            # Each frame is written as its 8-byte timestamp
+            self.output_file.write(self.image_timestamp.to_bytes(8, "little"))
+            self.recorded += 1
+            self.recording.status = True
+            self.recording.current_compression_time = COMPRESSION_TIME_MS
+            self.recording.average_compression_time = COMPRESSION_TIME_MS
+        return ERROR_CODE.SUCCESS
+
+    def get_timestamp(self, time_reference):
+        if time_reference == TIME_REFERENCE.IMAGE:
+            return Timestamp(self.image_timestamp)
+        return Timestamp(int(time.perf_counter() * 1e9))
+
+    def get_recording_status(self):
+        return self.recording
+
+    def disable_recording(self):
+        if self.output_file is not None:
+            self.output_file.close()
+            self.output_file = None
+        self.recording.is_recording = False
+
+    def close(self):
+        self.disable_recording()
+        self.opened = False
@@ -23,7 +23,6 @@
     a JPEG or PNG file. Depth map and Point Cloud can also be saved into files.
 """
 import sys
-import pyzed.sl as sl
 import cv2
 import argparse 
 import os 
@@ -35,7 +34,9 @@ def progress_bar(percent_done, bar_length=50):
     sys.stdout.write('[%s] %i%s\r' % (bar, percent_done, '%'))
     sys.stdout.flush()
     
-def main():
+def main(opt):
+    import pyzed.sl as sl
+
     filepath = opt.input_svo_file # Path to the .svo file to be playbacked
     input_type = sl.InputType()
     input_type.set_from_svo_file(filepath)  #Set init parameter to run from the .svo 
@@ -117,4 +118,4 @@ if __name__ == "__main__":
     if not os.path.isfile(opt.input_svo_file):
         print("--input_svo_file parameter should be an existing file but is not : ",opt.input_svo_file,"Exit program.")
         exit()
-    main()
+    main(opt)